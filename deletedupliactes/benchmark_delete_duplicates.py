@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import delete_duplicates
+
+STRATEGIES = ('naive', 'staged', 'parallel', 'index-cold', 'index-warm')
+SIZE_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+def generate_tree(root, files, mean_size, size_dist, dup_ratio, depth, seed):
+    """Create a reproducible synthetic tree of files under root.
+
+    The same arguments always produce the same directory layout, file sizes and
+    contents. A dup_ratio share of the files are exact copies of earlier files.
+    Returns the total number of bytes written.
+    """
+    rng = random.Random(seed)
+    dirs = [root]
+    for level in range(depth):
+        dirs += [os.path.join(d, f"d{level}_{i}") for d in dirs[-2 ** level:] for i in range(2)]
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+
+    def next_size():
+        if size_dist == 'fixed':
+            return mean_size
+        if size_dist == 'uniform':
+            return rng.randint(0, 2 * mean_size)
+        # Log-normal with the requested mean: many small files and a few large ones
+        sigma = 1.0
+        return int(rng.lognormvariate(0, sigma) * mean_size / 1.6487)
+
+    originals = []
+    total_bytes = 0
+    for i in range(files):
+        path = os.path.join(rng.choice(dirs), f"file_{i:07d}.bin")
+        if originals and rng.random() < dup_ratio:
+            data = rng.choice(originals)
+        else:
+            data = rng.randbytes(next_size())
+            originals.append(data)
+            # Keep a bounded pool of originals so large trees don't fill memory
+            if len(originals) > 1000:
+                originals.pop(rng.randrange(len(originals)))
+        with open(path, 'wb') as f:
+            f.write(data)
+        total_bytes += len(data)
+    return total_bytes
+
+def run_naive(directory, algorithm):
+    """The original approach: fully hash every file found by os.walk."""
+    seen = set()
+    stats = {'total_files_checked': 0, 'duplicates_found': 0, 'bytes_read': 0}
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            filepath = os.path.join(root, filename)
+            stats['total_files_checked'] += 1
+            file_hash = delete_duplicates.get_file_hash(filepath, algorithm)
+            stats['bytes_read'] += os.path.getsize(filepath)
+            if file_hash in seen:
+                stats['duplicates_found'] += 1
+            else:
+                seen.add(file_hash)
+    return stats
+
+def run_strategy(strategy, directory, algorithm, workers, index_file):
+    """Run one strategy in dry-run mode and return its statistics."""
+    if strategy == 'naive':
+        return run_naive(directory, algorithm)
+
+    index = delete_duplicates.HashIndex(index_file) if strategy.startswith('index') else None
+    with open(os.devnull, 'w') as devnull:
+        log = delete_duplicates.JsonlLog(devnull)
+        try:
+            stats = delete_duplicates.find_and_delete_duplicates(
+                directory, log, algorithm, workers if strategy != 'staged' else 1, index, dry_run=True)
+        finally:
+            if index is not None:
+                index.close()
+    stats['bytes_read'] = stats['partial_stage_bytes_read'] + stats['full_stage_bytes_read']
+    return stats
+
+def peak_rss_bytes():
+    """Return the peak resident set size of this process, if the platform reports it."""
+    # On Linux, getrusage() keeps the high-water mark of the parent across fork and
+    # exec, so the kernel's per-process VmHWM is used instead where available
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def measure(strategy, directory, algorithm, workers, index_file):
+    """Run a strategy in a fresh interpreter so its peak RSS is measured on its own."""
+    command = [sys.executable, os.path.abspath(__file__), '--run-strategy', strategy,
+               '--hash', algorithm, '--workers', str(workers), '--index-file', index_file, directory]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+def _child_main(args):
+    start = time.perf_counter()
+    stats = run_strategy(args.run_strategy, args.directory, args.hash, args.workers, args.index_file)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'seconds': elapsed,
+        'files': stats['total_files_checked'],
+        'duplicates_found': stats['duplicates_found'],
+        'bytes_read': stats['bytes_read'],
+        'peak_rss_bytes': peak_rss_bytes(),
+    }))
+
+def compare(results, previous_file):
+    """Print how each strategy's throughput changed since a previous results file."""
+    with open(previous_file, 'r') as f:
+        previous = {r['strategy']: r for r in json.load(f)['results']}
+    print(f"\nCompared with {previous_file}:")
+    for result in results:
+        before = previous.get(result['strategy'])
+        if not before or not before['files_per_second']:
+            continue
+        change = result['files_per_second'] / before['files_per_second'] - 1
+        print(f"  {result['strategy']:<12} {change:+.1%} files/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark delete_duplicates strategies on a synthetic tree.")
+    parser.add_argument("directory", nargs='?',
+                        help="Where to generate the tree (default: a temporary directory that is removed afterwards)")
+    parser.add_argument("--files", type=int, default=5000, help="Number of files to generate (default: 5000)")
+    parser.add_argument("--mean-size", type=int, default=64 * 1024,
+                        help="Mean file size in bytes (default: 65536)")
+    parser.add_argument("--size-dist", choices=SIZE_DISTRIBUTIONS, default='lognormal',
+                        help="Distribution of file sizes (default: lognormal)")
+    parser.add_argument("--dup-ratio", type=float, default=0.3,
+                        help="Share of files that are copies of another file (default: 0.3)")
+    parser.add_argument("--depth", type=int, default=4, help="Depth of the directory tree (default: 4)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the tree (default: 1)")
+    parser.add_argument("--strategies", nargs='+', choices=STRATEGIES, default=list(STRATEGIES),
+                        help="Strategies to run (default: all)")
+    parser.add_argument("--hash", choices=delete_duplicates.HASH_ALGORITHMS, default='md5',
+                        help="Hash algorithm (default: md5)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Workers used by the parallel and index strategies (default: 8)")
+    parser.add_argument("--output", help="Results file (default: benchmark_YYYY_MM_DD_HH_MM_SS.json)")
+    parser.add_argument("--compare", metavar="RESULTS_FILE", help="Previous results file to compare against")
+    parser.add_argument("--run-strategy", choices=STRATEGIES, help=argparse.SUPPRESS)
+    parser.add_argument("--index-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_strategy:
+        _child_main(args)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="dedup_bench_") as temp_dir:
+        directory = args.directory or os.path.join(temp_dir, "tree")
+        if os.path.exists(directory) and os.listdir(directory):
+            print(f"Error: {directory} is not empty.")
+            sys.exit(1)
+
+        print(f"Generating {args.files} files in {directory}...")
+        total_bytes = generate_tree(directory, args.files, args.mean_size, args.size_dist,
+                                    args.dup_ratio, args.depth, args.seed)
+        print(f"Generated {delete_duplicates.format_bytes(total_bytes)}.\n")
+
+        # The warm run reuses the index the cold run filled
+        index_file = os.path.join(temp_dir, "index.sqlite")
+        results = []
+        print(f"{'Strategy':<12} | {'Files/s':>10} | {'MB/s':>8} | {'Peak RSS':>10} | {'Bytes read':>11} | Duplicates")
+        print("-" * 80)
+        for strategy in args.strategies:
+            if strategy == 'index-warm' and not os.path.exists(index_file):
+                measure('index-cold', directory, args.hash, args.workers, index_file)
+            run = measure(strategy, directory, args.hash, args.workers, index_file)
+            seconds = max(run['seconds'], 1e-9)
+            result = {
+                'strategy': strategy,
+                'seconds': run['seconds'],
+                'files_per_second': run['files'] / seconds,
+                'mb_per_second': total_bytes / seconds / 1e6,
+                'peak_rss_bytes': run['peak_rss_bytes'],
+                'bytes_read': run['bytes_read'],
+                'duplicates_found': run['duplicates_found'],
+            }
+            results.append(result)
+            rss = delete_duplicates.format_bytes(run['peak_rss_bytes']) if run['peak_rss_bytes'] else "n/a"
+            print(f"{strategy:<12} | {result['files_per_second']:>10.0f} | {result['mb_per_second']:>8.1f} | "
+                  f"{rss:>10} | {delete_duplicates.format_bytes(run['bytes_read']):>11} | {run['duplicates_found']}")
+
+    report = {
+        'timestamp': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'tree': {
+            'files': args.files,
+            'total_bytes': total_bytes,
+            'mean_size': args.mean_size,
+            'size_dist': args.size_dist,
+            'dup_ratio': args.dup_ratio,
+            'depth': args.depth,
+            'seed': args.seed,
+        },
+        'hash': args.hash,
+        'workers': args.workers,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    output = args.output or f"benchmark_{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -3,79 +3,836 @@ import hashlib
 import argparse
 from datetime import datetime
 import sys
+import errno
+import json
+import shutil
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-def get_file_hash(filepath):
-    """Calculate the MD5 hash of a file."""
-    hasher = hashlib.md5()
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+HASH_ALGORITHMS = ('md5', 'sha1', 'blake2b')
+MODES = ('delete', 'hardlink', 'reflink')
+
+# ioctl request that makes a file share the data blocks of another (Linux btrfs, XFS, ...)
+FICLONE = 0x40049409
+# errno values meaning the filesystem or platform cannot clone files
+REFLINK_UNSUPPORTED_ERRORS = {errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS}
+
+# Number of bytes read from each end of a file during the partial-hash stage
+PARTIAL_BLOCK_SIZE = 4096
+READ_CHUNK_SIZE = 65536
+# Upper bound on hash jobs queued ahead of the results being consumed
+MAX_PENDING_JOBS = 1024
+
+DEFAULT_INDEX_FILE = os.path.join(os.path.expanduser("~"), ".delete_duplicates_index.sqlite")
+INDEX_SCHEMA_VERSION = 2
+# Number of index writes between commits, so an interrupted run keeps most of its work
+INDEX_COMMIT_INTERVAL = 10000
+# Number of walked files written to the size-stage table at once
+FILE_TABLE_BATCH_SIZE = 1000
+
+DEFAULT_CHECKPOINT_FILE = "delete_duplicates_checkpoint.jsonl"
+CHECKPOINT_VERSION = 1
+DEFAULT_CHECKPOINT_INTERVAL = 60
+
+# The JSONL log is flushed after this many records or seconds, whichever comes first
+LOG_FLUSH_RECORDS = 1000
+LOG_FLUSH_SECONDS = 5
+
+def get_file_hash(filepath, algorithm='md5'):
+    """Calculate the hash of a file using the given hashlib algorithm."""
+    hasher = hashlib.new(algorithm)
     with open(filepath, 'rb') as file:
-        buf = file.read(65536)
+        buf = file.read(READ_CHUNK_SIZE)
         while len(buf) > 0:
             hasher.update(buf)
-            buf = file.read(65536)
-    return hasher.hexdigest()
-
-def find_and_delete_duplicates(directory, log_file):
-    """Find and delete duplicate files in the given directory and its subdirectories."""
-    file_hashes = {}
-    duplicates_found = 0
-    duplicates_deleted = 0
-    total_files_checked = 0
-
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            filepath = os.path.join(root, filename)
-            total_files_checked += 1
-            
+            buf = file.read(READ_CHUNK_SIZE)
+    return hasher.digest()
+
+def get_partial_hash(filepath, size, algorithm='md5'):
+    """Calculate the hash of the first and last PARTIAL_BLOCK_SIZE bytes of a file.
+
+    Returns the digest and the number of bytes read. Files no larger than two
+    blocks are read in full, so their partial hash is already a full-content hash.
+    """
+    hasher = hashlib.new(algorithm)
+    with open(filepath, 'rb') as file:
+        if size <= 2 * PARTIAL_BLOCK_SIZE:
+            data = file.read()
+            hasher.update(data)
+            return hasher.digest(), len(data)
+        head = file.read(PARTIAL_BLOCK_SIZE)
+        file.seek(-PARTIAL_BLOCK_SIZE, os.SEEK_END)
+        tail = file.read(PARTIAL_BLOCK_SIZE)
+        hasher.update(head)
+        hasher.update(tail)
+        return hasher.digest(), len(head) + len(tail)
+
+class JsonlLog:
+    """Writes one JSON object per line to a log file, flushing it periodically."""
+
+    def __init__(self, file):
+        self.file = file
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, event, **fields):
+        record = {'time': datetime.now().astimezone().isoformat(timespec='seconds'), 'event': event}
+        record.update(fields)
+        self.file.write(json.dumps(record) + '\n')
+        self.unflushed += 1
+        if self.unflushed >= LOG_FLUSH_RECORDS or time.monotonic() - self.last_flush >= LOG_FLUSH_SECONDS:
+            self.flush()
+
+    def error(self, operation, path, error):
+        self.write('error', operation=operation, path=path, message=str(error))
+
+    def flush(self):
+        self.file.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+class HashIndex:
+    """On-disk cache of file digests, keyed by device, inode, size and mtime_ns.
+
+    A stored digest is reused only while all four key fields (and the hash
+    algorithm) still match the file on disk. Every file looked up during a run is
+    stamped with the run id, so only the entries that were not touched need to be
+    checked when pruning.
+    """
+    name = 'index'
+
+    def __init__(self, index_file, rebuild=False):
+        self.conn = sqlite3.connect(index_file)
+        self.run_id = time.time_ns()
+        self.pending_writes = 0
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if rebuild or version != INDEX_SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS file_hashes")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                algorithm TEXT NOT NULL,
+                partial_hash BLOB,
+                full_hash BLOB,
+                path TEXT NOT NULL,
+                last_seen INTEGER NOT NULL,
+                PRIMARY KEY (dev, ino)
+            )
+        """)
+        self.conn.execute(f"PRAGMA user_version = {INDEX_SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def lookup(self, stage, entry, size, algorithm):
+        """Return the stored digest for this stage, or None if the file changed."""
+        filepath, dev, ino, mtime_ns = entry
+        row = self.conn.execute(
+            f"SELECT size, mtime_ns, algorithm, {stage}_hash FROM file_hashes WHERE dev = ? AND ino = ?",
+            (dev, ino),
+        ).fetchone()
+        if row is None or row[:3] != (size, mtime_ns, algorithm) or row[3] is None:
+            return None
+        self.conn.execute(
+            "UPDATE file_hashes SET path = ?, last_seen = ? WHERE dev = ? AND ino = ?",
+            (filepath, self.run_id, dev, ino),
+        )
+        self._wrote()
+        return row[3]
+
+    def store(self, stage, entry, size, algorithm, digest):
+        """Record a freshly computed digest, discarding digests of an older file version."""
+        filepath, dev, ino, mtime_ns = entry
+        other = 'full' if stage == 'partial' else 'partial'
+        self.conn.execute(f"""
+            INSERT INTO file_hashes (dev, ino, size, mtime_ns, algorithm, {stage}_hash, path, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (dev, ino) DO UPDATE SET
+                {other}_hash = CASE
+                    WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns
+                         AND algorithm = excluded.algorithm THEN {other}_hash
+                    ELSE NULL END,
+                {stage}_hash = excluded.{stage}_hash,
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                algorithm = excluded.algorithm,
+                path = excluded.path,
+                last_seen = excluded.last_seen
+        """, (dev, ino, size, mtime_ns, algorithm, digest, filepath, self.run_id))
+        self._wrote()
+
+    def prune(self, root):
+        """Remove entries under root for files that no longer exist.
+
+        An entry that was not looked up during this run is kept as long as its
+        path still leads to the same inode, so the digests of files that have a
+        unique size for now are not thrown away.
+        """
+        prefix = os.path.join(root, '')
+        stale = []
+        for dev, ino, path in self.conn.execute(
+            "SELECT dev, ino, path FROM file_hashes WHERE last_seen != ? AND substr(path, 1, ?) = ?",
+            (self.run_id, len(prefix), prefix),
+        ):
             try:
-                file_hash = get_file_hash(filepath)
-            except IOError as e:
-                log_file.write(f"Error reading file {filepath}: {str(e)}\n")
+                st = os.lstat(path)
+            except OSError:
+                stale.append((dev, ino))
                 continue
+            if (st.st_dev, st.st_ino) != (dev, ino):
+                stale.append((dev, ino))
+        self.conn.executemany("DELETE FROM file_hashes WHERE dev = ? AND ino = ?", stale)
+        self.conn.commit()
+        return len(stale)
 
-            if file_hash in file_hashes:
-                duplicates_found += 1
-                original_path = file_hashes[file_hash]
-                log_file.write(f"Duplicate found:\n  Original: {original_path}\n  Duplicate: {filepath}\n")
-                
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def _wrote(self):
+        self.pending_writes += 1
+        if self.pending_writes >= INDEX_COMMIT_INTERVAL:
+            self.conn.commit()
+            self.pending_writes = 0
+
+class Checkpoint:
+    """Append-only record of the digests computed so far, used to resume a run.
+
+    The file starts with a header describing the run (roots and hash settings),
+    followed by one line per computed digest. Every interval seconds the file is
+    flushed to disk together with a progress line. When resuming, the digests of
+    files that are unchanged since they were recorded are reused.
+    """
+    name = 'checkpoint'
+
+    def __init__(self, checkpoint_file, roots, algorithm, interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 resume=False):
+        self.checkpoint_file = checkpoint_file
+        self.interval = interval
+        self.digests = {}
+        self.recorded = {'partial': 0, 'full': 0}
+        self.header = {
+            'type': 'header',
+            'version': CHECKPOINT_VERSION,
+            'roots': roots,
+            'hash': algorithm,
+            'partial_block_size': PARTIAL_BLOCK_SIZE,
+        }
+        if resume:
+            self._load()
+            self.file = open(checkpoint_file, 'a')
+        else:
+            self.file = open(checkpoint_file, 'w')
+            self.file.write(json.dumps(self.header) + '\n')
+        self.last_save = time.monotonic()
+
+    def _load(self):
+        """Read the digests recorded by an interrupted run with the same settings."""
+        with open(self.checkpoint_file, 'r') as f:
+            header = json.loads(f.readline() or 'null')
+            if header != self.header:
+                raise ValueError("checkpoint was written for different directories or hash settings")
+            for line in f:
                 try:
-                    os.remove(filepath)
-                    log_file.write(f"Deleted: {filepath}\n")
-                    duplicates_deleted += 1
-                except OSError as e:
-                    log_file.write(f"Error deleting file {filepath}: {str(e)}\n")
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # The last line may be incomplete if the run was killed mid-write
+                if record.get('type') != 'digest':
+                    continue
+                key = (record['dev'], record['ino'])
+                file_key = (record['size'], record['mtime_ns'])
+                cached = self.digests.get(key)
+                if cached is None or cached[0] != file_key:
+                    cached = self.digests[key] = (file_key, {})
+                cached[1][record['stage']] = bytes.fromhex(record['digest'])
+                self.recorded[record['stage']] += 1
+
+    def lookup(self, stage, entry, size, algorithm):
+        """Return the digest recorded before the interruption, or None."""
+        _, dev, ino, mtime_ns = entry
+        cached = self.digests.get((dev, ino))
+        if cached is None or cached[0] != (size, mtime_ns):
+            return None
+        return cached[1].get(stage)
+
+    def store(self, stage, entry, size, algorithm, digest):
+        filepath, dev, ino, mtime_ns = entry
+        self.file.write(json.dumps({
+            'type': 'digest', 'stage': stage, 'path': filepath, 'dev': dev, 'ino': ino,
+            'size': size, 'mtime_ns': mtime_ns, 'digest': digest.hex(),
+        }) + '\n')
+        self.recorded[stage] += 1
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save()
+
+    def save(self):
+        """Write a progress line and make everything recorded so far durable."""
+        self.file.write(json.dumps({
+            'type': 'progress',
+            'time': datetime.now().astimezone().isoformat(timespec='seconds'),
+            'partial_digests': self.recorded['partial'],
+            'full_digests': self.recorded['full'],
+        }) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_save = time.monotonic()
+
+    def close(self, completed):
+        """Save the checkpoint, or remove it once the run has completed."""
+        if completed:
+            self.file.close()
+            os.remove(self.checkpoint_file)
+        else:
+            self.save()
+            self.file.close()
+
+def _hash_job(job):
+    """Hash one file for the given stage, returning the error instead of raising it."""
+    stage, (filepath, *_), size, algorithm = job
+    try:
+        if stage == 'partial':
+            digest, bytes_read = get_partial_hash(filepath, size, algorithm)
+        else:
+            digest, bytes_read = get_file_hash(filepath, algorithm), size
+        return digest, bytes_read, None
+    except IOError as e:
+        return None, 0, e
+
+def hash_files(jobs, workers, stats, caches=()):
+    """Run hash jobs, yielding (job, (digest, bytes_read, error)) in submission order.
+
+    Files whose digest is still valid in one of the caches (a Checkpoint or a
+    HashIndex) are not read again, and fresh digests are stored in all of them.
+    With more than one worker the remaining files are hashed on a thread pool;
+    hashlib and file reads release the GIL, so threads keep several reads in
+    flight. Results are always yielded in the order the jobs were given, which
+    keeps the choice of "original" independent of the number of workers.
+    """
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    # Queue of (job, future, result); cached results wait here behind earlier jobs
+    pending = deque()
+    try:
+        for job in jobs:
+            digest = _lookup(caches, job, stats)
+            if digest is not None:
+                pending.append((job, None, (digest, 0, None)))
+            elif executor is None:
+                pending.append((job, None, _hash_and_store(job, caches)))
             else:
-                file_hashes[file_hash] = filepath
+                pending.append((job, executor.submit(_hash_job, job), None))
+
+            while pending and (executor is None or len(pending) >= MAX_PENDING_JOBS):
+                yield _collect(pending.popleft(), caches)
+        while pending:
+            yield _collect(pending.popleft(), caches)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+def _lookup(caches, job, stats):
+    """Return the first cached digest for a job, counting hits and misses per cache."""
+    for cache in caches:
+        digest = cache.lookup(*job)
+        if digest is not None:
+            stats[f'{cache.name}_hits'] += 1
+            return digest
+        stats[f'{cache.name}_misses'] += 1
+    return None
+
+def _hash_and_store(job, caches, result=None):
+    """Hash a file (unless already done) and record its digest in the caches."""
+    if result is None:
+        result = _hash_job(job)
+    digest, _, error = result
+    if error is None:
+        for cache in caches:
+            cache.store(*job, digest)
+    return result
+
+def _collect(item, caches):
+    """Return a queued job with its result, waiting for the worker if needed."""
+    job, future, result = item
+    if future is not None:
+        result = _hash_and_store(job, caches, future.result())
+    return job, result
+
+def walk_files(directory, log, skip_dirs=()):
+    """Yield (dirpath, name, stat_result) for every regular file below directory.
+
+    Directories are read with os.scandir in the same top-down order as os.walk.
+    Symlinks are not followed, and each file is stat'ed exactly once. Any
+    directory in skip_dirs is left out, along with everything below it.
+    """
+    stack = [directory]
+    while stack:
+        dirpath = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(dirpath) as it:
+                for dir_entry in it:
+                    try:
+                        if dir_entry.is_dir(follow_symlinks=False):
+                            if dir_entry.path not in skip_dirs:
+                                subdirs.append(dir_entry.path)
+                        elif dir_entry.is_file(follow_symlinks=False):
+                            yield dirpath, dir_entry.name, dir_entry.stat(follow_symlinks=False)
+                    except OSError as e:
+                        log.error('stat', dir_entry.path, e)
+        except OSError as e:
+            log.error('scan', dirpath, e)
+        stack.extend(reversed(subdirs))
+
+def normalize_roots(directories):
+    """Resolve the directories to scan, dropping repeats and directories nested in earlier ones."""
+    roots = []
+    for directory in directories:
+        root = os.path.realpath(directory)
+        if not any(root == r or root.startswith(os.path.join(r, '')) for r in roots):
+            roots.append(root)
+    return roots
+
+class FileTable:
+    """Temporary on-disk table of the files found by the walk, for the size stage.
+
+    Files are written to a private SQLite database as they are found, so memory
+    stays flat however many files the tree holds; SQLite deletes the database
+    when it is closed. Each file is a (dir_id, name, st_dev, st_ino,
+    st_mtime_ns) row numbered in walk order, with directory paths stored once.
+    Only the sizes shared by several files are read back, one group at a time.
+    """
 
-    return total_files_checked, duplicates_found, duplicates_deleted
+    def __init__(self):
+        # An empty name gives a temporary database that is kept on disk
+        self.conn = sqlite3.connect("")
+        self.conn.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE dirs (id INTEGER PRIMARY KEY, path TEXT NOT NULL);
+            CREATE TABLE files (
+                seq INTEGER PRIMARY KEY,
+                size INTEGER NOT NULL,
+                dir_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            );
+            CREATE TABLE linked_inodes (dev INTEGER, ino INTEGER, PRIMARY KEY (dev, ino)) WITHOUT ROWID;
+        """)
+        self.pending = []
+        self.dir_id = None
+        self.dirpath = None
+
+    def add_linked(self, dev, ino):
+        """Record an inode with several links, returning False if it was recorded before."""
+        cursor = self.conn.execute("INSERT OR IGNORE INTO linked_inodes (dev, ino) VALUES (?, ?)", (dev, ino))
+        return cursor.rowcount == 1
+
+    def add(self, dirpath, name, st):
+        if dirpath != self.dirpath:
+            # Directories are walked one at a time, so only the current one is needed
+            self.dir_id = self.conn.execute("INSERT INTO dirs (path) VALUES (?)", (dirpath,)).lastrowid
+            self.dirpath = dirpath
+        self.pending.append((st.st_size, self.dir_id, name, st.st_dev, st.st_ino, st.st_mtime_ns))
+        if len(self.pending) >= FILE_TABLE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.conn.executemany(
+            "INSERT INTO files (size, dir_id, name, dev, ino, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)", self.pending)
+        self.pending = []
+
+    def finish(self):
+        """Index the table by size once the walk is done, and return the bytes of files with a unique size."""
+        self.flush()
+        self.conn.execute("CREATE INDEX files_by_size ON files (size, seq)")
+        return self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT size FROM files GROUP BY size HAVING COUNT(*) = 1)"
+        ).fetchone()[0]
+
+    def candidate_sizes(self):
+        """Yield the sizes shared by several files, in the order they were first found."""
+        yield from (size for size, in self.conn.execute(
+            "SELECT size FROM files GROUP BY size HAVING COUNT(*) > 1 ORDER BY MIN(seq)"))
+
+    def entries(self, size):
+        """Return the (path, st_dev, st_ino, st_mtime_ns) entries of a size, in walk order."""
+        return [(os.path.join(dirpath, name), dev, ino, mtime_ns) for dirpath, name, dev, ino, mtime_ns in self.conn.execute(
+            "SELECT dirs.path, files.name, files.dev, files.ino, files.mtime_ns FROM files"
+            " JOIN dirs ON dirs.id = files.dir_id WHERE files.size = ? ORDER BY files.seq", (size,))]
+
+    def close(self):
+        self.conn.close()
+
+def group_by_size(roots, log, stats):
+    """Stage 1: walk the roots in order and record every file in a FileTable.
+
+    Further hardlinks to an inode that was already recorded are skipped, as they
+    share their data with it already.
+    """
+    table = FileTable()
+    try:
+        for dirpath, name, st in _walk_roots(roots, log):
+            # Only files with several links can be reached twice, so only those are tracked
+            if st.st_nlink > 1 and not table.add_linked(st.st_dev, st.st_ino):
+                stats['hardlinks_skipped'] += 1
+                continue
+            stats['total_files_checked'] += 1
+            stats['total_bytes'] += st.st_size
+            table.add(dirpath, name, st)
+        stats['size_stage_bytes_avoided'] += table.finish()
+    except BaseException:
+        table.close()
+        raise
+    return table
+
+def _walk_roots(roots, log):
+    for root in roots:
+        # A later root may contain an earlier one, which has already been walked
+        yield from walk_files(root, log, skip_dirs=set(roots) - {root})
+
+def group_by_partial_hash(table, log, stats, algorithm='md5', workers=1, caches=()):
+    """Stage 2: split each size group by the hash of the file's head and tail.
+
+    Yields (size, entries, fully_read) groups one size at a time, loading each
+    size's files from the FileTable only when they are queued for hashing.
+    """
+    def jobs():
+        for size in table.candidate_sizes():
+            for entry in table.entries(size):
+                yield 'partial', entry, size, algorithm
+
+    by_hash = {}
+    current_size = None
+    for (_, entry, size, _), (partial_hash, bytes_read, error) in hash_files(jobs(), workers, stats, caches):
+        if size != current_size:
+            yield from _partial_groups(current_size, by_hash, stats)
+            by_hash = {}
+            current_size = size
+        if error:
+            log.error('read', entry[0], error)
+            continue
+        stats['partial_stage_bytes_read'] += bytes_read
+        by_hash.setdefault(partial_hash, []).append(entry)
+    yield from _partial_groups(current_size, by_hash, stats)
+
+def _partial_groups(size, by_hash, stats):
+    for partial_hash, entries in by_hash.items():
+        if len(entries) > 1:
+            # Small files were read in full, so they need no further hashing
+            yield size, partial_hash, entries, size <= 2 * PARTIAL_BLOCK_SIZE
+        else:
+            stats['partial_stage_bytes_avoided'] += max(size - 2 * PARTIAL_BLOCK_SIZE, 0)
+
+def group_by_full_hash(groups, log, stats, algorithm='md5', workers=1, caches=()):
+    """Stage 3: full-hash the surviving candidates, yielding (size, digest, entries) duplicate groups."""
+    # Groups whose partial hash already covers the whole file skip the hashing
+    # and are handed straight back as soon as the job generator reaches them
+    ready = deque()
+
+    def jobs():
+        for size, partial_hash, entries, fully_read in groups:
+            if fully_read:
+                ready.append((size, partial_hash, entries))
+                continue
+            for entry in entries:
+                yield 'full', entry, size, algorithm
+
+    by_hash = {}
+    current_size = None
+    for (_, entry, size, _), (file_hash, bytes_read, error) in hash_files(jobs(), workers, stats, caches):
+        while ready:
+            yield ready.popleft()
+        if size != current_size:
+            yield from _full_groups(current_size, by_hash)
+            by_hash = {}
+            current_size = size
+        if error:
+            log.error('read', entry[0], error)
+            continue
+        stats['full_stage_bytes_read'] += bytes_read
+        by_hash.setdefault(file_hash, []).append(entry)
+    yield from _full_groups(current_size, by_hash)
+    while ready:
+        yield ready.popleft()
+
+def _full_groups(size, by_hash):
+    for file_hash, entries in by_hash.items():
+        if len(entries) > 1:
+            yield size, file_hash, entries
+
+def reflink_file(src, dst):
+    """Create dst as a copy-on-write clone of src, sharing its data blocks."""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+    with open(src, 'rb') as src_file, open(dst, 'xb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+def replace_duplicate(original, duplicate, mode):
+    """Reclaim the space used by duplicate according to mode.
+
+    'delete' removes the duplicate. 'hardlink' and 'reflink' create a link or
+    clone of the original next to the duplicate and atomically rename it over
+    the duplicate, so its path stays valid. Returns the action taken, which is
+    'kept_copy' if the filesystem cannot create reflinks.
+    """
+    if mode == 'delete':
+        os.remove(duplicate)
+        return 'deleted'
+
+    directory, name = os.path.split(duplicate)
+    temp_path = os.path.join(directory, f".{name}.dedup-{os.getpid()}")
+    try:
+        if mode == 'hardlink':
+            os.link(original, temp_path)
+        else:
+            try:
+                reflink_file(original, temp_path)
+            except OSError as e:
+                if e.errno in REFLINK_UNSUPPORTED_ERRORS:
+                    # The duplicate is already a plain copy, so leave it as one
+                    return 'kept_copy'
+                raise
+            shutil.copystat(duplicate, temp_path)
+        os.replace(temp_path, duplicate)
+    finally:
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+    return 'hardlinked' if mode == 'hardlink' else 'reflinked'
+
+def _unchanged(entry):
+    """Check that a file is still the one that was hashed."""
+    filepath, dev, ino, mtime_ns = entry
+    try:
+        st = os.lstat(filepath)
+    except OSError:
+        return False
+    return (st.st_dev, st.st_ino, st.st_mtime_ns) == (dev, ino, mtime_ns)
+
+def find_and_delete_duplicates(directories, log, algorithm='md5', workers=1, index=None,
+                               mode='delete', dry_run=False, checkpoint=None):
+    """Find and delete duplicate files in the given directories and their subdirectories.
+
+    Files are narrowed down in three stages: by size, then by a hash of their
+    first and last few KB, and only the remaining candidates are hashed in full.
+    Within each group of identical files the first one found by the walk is kept,
+    and the others are deleted or replaced by hardlinks or reflinks to it,
+    depending on mode. With dry_run, duplicates are only reported.
+    Duplicates are found across all directories; files in earlier directories
+    are preferred as originals.
+    If a HashIndex is given, digests of unchanged files are taken from it.
+    If a Checkpoint is given, digests are recorded in it as they are computed,
+    and digests it holds from an interrupted run are reused.
+    Every duplicate, replacement and error is written as a record to the JsonlLog.
+    """
+    stats = {
+        'total_files_checked': 0,
+        'total_bytes': 0,
+        'duplicates_found': 0,
+        'duplicates_deleted': 0,
+        'duplicates_hardlinked': 0,
+        'duplicates_reflinked': 0,
+        'duplicates_kept_copy': 0,
+        'bytes_reclaimed': 0,
+        'hardlinks_skipped': 0,
+        'size_stage_bytes_avoided': 0,
+        'partial_stage_bytes_read': 0,
+        'partial_stage_bytes_avoided': 0,
+        'full_stage_bytes_read': 0,
+        'index_hits': 0,
+        'index_misses': 0,
+        'index_pruned': 0,
+        'checkpoint_hits': 0,
+        'checkpoint_misses': 0,
+    }
+
+    if isinstance(directories, str):
+        directories = [directories]
+    roots = normalize_roots(directories)
+    caches = [cache for cache in (checkpoint, index) if cache is not None]
+    table = group_by_size(roots, log, stats)
+    try:
+        groups = group_by_partial_hash(table, log, stats, algorithm, workers, caches)
+
+        for size, digest, entries in group_by_full_hash(groups, log, stats, algorithm, workers, caches):
+            original = entries[0]
+            for duplicate in entries[1:]:
+                filepath = duplicate[0]
+                stats['duplicates_found'] += 1
+                log.write('duplicate', original=original[0], duplicate=filepath, size=size, digest=digest.hex())
+                if dry_run:
+                    continue
+
+                if not (_unchanged(original) and _unchanged(duplicate)):
+                    log.write('skipped', path=filepath, reason="file changed since it was hashed")
+                    continue
+                try:
+                    action = replace_duplicate(original[0], filepath, mode)
+                except OSError as e:
+                    log.error(mode, filepath, e)
+                    continue
+                log.write(action, path=filepath, original=original[0])
+                stats[f'duplicates_{action}'] += 1
+                if action != 'kept_copy':
+                    stats['bytes_reclaimed'] += size
+    finally:
+        table.close()
+
+    if index is not None:
+        for root in roots:
+            stats['index_pruned'] += index.prune(root)
+    return stats
+
+def format_bytes(num_bytes):
+    """Format a byte count using binary units."""
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if num_bytes < 1024 or unit == 'TiB':
+            return f"{num_bytes:.1f} {unit}" if unit != 'B' else f"{num_bytes} B"
+        num_bytes /= 1024
+
+def format_summary(stats, args):
+    """Build the human-readable summary printed at the end of a run."""
+    bytes_read = stats['partial_stage_bytes_read'] + stats['full_stage_bytes_read']
+    lines = [
+        "",
+        "Summary:",
+        f"Total files checked: {stats['total_files_checked']}",
+        f"Extra hardlinks skipped: {stats['hardlinks_skipped']}",
+    ]
+    if args.dry_run:
+        lines.append(f"Duplicates found (dry run, nothing changed): {stats['duplicates_found']}")
+    else:
+        lines.append(f"Duplicates found: {stats['duplicates_found']}")
+        if args.mode == 'delete':
+            lines.append(f"Duplicates successfully deleted: {stats['duplicates_deleted']}")
+        elif args.mode == 'hardlink':
+            lines.append(f"Duplicates replaced with hardlinks: {stats['duplicates_hardlinked']}")
+        else:
+            lines.append(f"Duplicates replaced with reflinks: {stats['duplicates_reflinked']}")
+            lines.append(f"Duplicates kept as copies (reflinks unsupported): {stats['duplicates_kept_copy']}")
+        lines.append(f"Space reclaimed: {format_bytes(stats['bytes_reclaimed'])}")
+
+    lines += [
+        "",
+        f"Bytes read: {format_bytes(bytes_read)} of {format_bytes(stats['total_bytes'])} scanned",
+        f"  Size stage avoided reading: {format_bytes(stats['size_stage_bytes_avoided'])}",
+        f"  Partial-hash stage read {format_bytes(stats['partial_stage_bytes_read'])}, "
+        f"avoided reading: {format_bytes(stats['partial_stage_bytes_avoided'])}",
+        f"  Full-hash stage read: {format_bytes(stats['full_stage_bytes_read'])}",
+        "",
+    ]
+    if stats['checkpoint_hits']:
+        lines.append(f"Digests reused from checkpoint: {stats['checkpoint_hits']}")
+    if args.no_index:
+        lines.append("Hash index: disabled")
+    else:
+        lines.append(f"Hash index: {stats['index_hits']} hits, {stats['index_misses']} misses, "
+                     f"{stats['index_pruned']} stale entries pruned")
+    return "\n".join(lines) + "\n"
 
 def main():
-    parser = argparse.ArgumentParser(description="Find and delete duplicate files in a directory.")
-    parser.add_argument("directory", help="The directory to search for duplicates")
+    parser = argparse.ArgumentParser(description="Find and delete duplicate files in one or more directories.")
+    parser.add_argument("directories", nargs='+', metavar="directory",
+                        help="The directories to search for duplicates; files in earlier directories are kept")
+    parser.add_argument("--hash", choices=HASH_ALGORITHMS, default='md5',
+                        help="Hash algorithm used to compare file contents (default: md5)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of files to hash in parallel (default: 1)")
+    parser.add_argument("--index", default=DEFAULT_INDEX_FILE,
+                        help=f"Hash index file reused between runs (default: {DEFAULT_INDEX_FILE})")
+    parser.add_argument("--no-index", action="store_true",
+                        help="Hash every candidate file without reading or updating the index")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="Discard the existing index and rebuild it from this run")
+    parser.add_argument("--mode", choices=MODES, default='delete',
+                        help="What to do with each duplicate: delete it, or replace it with a hardlink "
+                             "or reflink to the original (default: delete)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Find and log duplicates without changing any files")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_FILE,
+                        help=f"File that records progress so an interrupted run can be resumed "
+                             f"(default: {DEFAULT_CHECKPOINT_FILE})")
+    parser.add_argument("--checkpoint-interval", type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help=f"Seconds between checkpoint saves (default: {DEFAULT_CHECKPOINT_INTERVAL})")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its checkpoint, if there is one")
     args = parser.parse_args()
 
-    if not os.path.isdir(args.directory):
-        print(f"Error: {args.directory} is not a valid directory.")
+    if args.workers < 1:
+        print("Error: --workers must be at least 1.")
+        sys.exit(1)
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            print(f"Error: {directory} is not a valid directory.")
+            sys.exit(1)
+    roots = normalize_roots(args.directories)
+
+    resume = args.resume and os.path.exists(args.checkpoint)
+    if args.resume and not resume:
+        print(f"No checkpoint found at {args.checkpoint}, starting a new run.")
+    elif not args.resume and os.path.exists(args.checkpoint):
+        print(f"Error: a checkpoint from an interrupted run exists at {args.checkpoint}. "
+              f"Use --resume to continue it, or delete it to start over.")
+        sys.exit(1)
+    # The index is opened first, so a failure to open it leaves no checkpoint behind
+    index = None
+    if not args.no_index:
+        try:
+            index = HashIndex(args.index, rebuild=args.rebuild_index)
+        except sqlite3.Error as e:
+            print(f"Error: could not open hash index {args.index}: {e}")
+            sys.exit(1)
+
+    try:
+        checkpoint = Checkpoint(args.checkpoint, roots, args.hash, args.checkpoint_interval, resume)
+    except (OSError, ValueError) as e:
+        print(f"Error: could not use checkpoint {args.checkpoint}: {e}")
+        if index is not None:
+            index.close()
         sys.exit(1)
 
     timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-    log_filename = f"delete_duplicates_{timestamp}.log"
+    log_filename = f"delete_duplicates_{timestamp}.jsonl"
 
     with open(log_filename, 'w') as log_file:
-        print(f"Searching for duplicates in {args.directory}")
+        log = JsonlLog(log_file)
+        print(f"Searching for duplicates in {', '.join(roots)}")
+        if resume:
+            print(f"Resuming from {args.checkpoint} "
+                  f"({sum(checkpoint.recorded.values())} digests already computed).")
+        if args.dry_run:
+            print("Dry run: no files will be changed.")
         print(f"Logging details to {log_filename}")
-        
-        total_files, duplicates_found, duplicates_deleted = find_and_delete_duplicates(args.directory, log_file)
-
-        summary = f"""
-Summary:
-Total files checked: {total_files}
-Duplicates found: {duplicates_found}
-Duplicates successfully deleted: {duplicates_deleted}
-        """
-        log_file.write(summary)
+        log.write('start', directories=roots, hash=args.hash, workers=args.workers,
+                  mode=args.mode, dry_run=args.dry_run, resumed=resume)
+
+        completed = False
+        try:
+            stats = find_and_delete_duplicates(roots, log, args.hash, args.workers, index,
+                                               args.mode, args.dry_run, checkpoint)
+            completed = True
+        except KeyboardInterrupt:
+            print(f"\nInterrupted. Run again with --resume to continue from {args.checkpoint}.")
+            sys.exit(130)
+        finally:
+            checkpoint.close(completed)
+            if index is not None:
+                index.close()
+            log.flush()
+        log.write('summary', **stats)
+        log.flush()
+        summary = format_summary(stats, args)
         print(summary)
         print(f"Detailed log saved to {log_filename}")
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,108 @@
+# benchmark_startup.py
+"""
+Measures how long simpleagent takes to start, for the script and for the
+frozen PyInstaller build. For the script, each task is started several times
+in a fresh interpreter by a small probe that imports main.py, loads the config
+and imports the task's plugin the same way main.py does, noting the time after
+each step. The frozen build can't run the probe, so the time until
+'simpleagent --help' exits is measured instead: interpreter start-up,
+unpacking and main.py's imports.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from main import PLUGINS
+
+BASE_PATH = Path(__file__).parent
+DEFAULT_BINARY = BASE_PATH / "dist" / "simpleagent"
+
+# Run in a fresh interpreter with the task and config file as arguments
+PROBE = """
+import json, sys, time
+started = time.time()
+sys.path.insert(0, {base!r})
+import main
+imported = time.time()
+main.load_configuration(sys.argv[2])
+config_loaded = time.time()
+main.load_plugin(sys.argv[1])
+print(json.dumps({{"started": started, "imported": imported, "config_loaded": config_loaded, "first_call": time.time()}}))
+"""
+
+# (column, start mark, end mark) of the reported steps
+STEPS = (
+    ("interpreter", "spawned", "started"),   # Python start-up
+    ("imports", "started", "imported"),      # main.py's own imports
+    ("config", "imported", "config_loaded"),
+    ("plugin import", "config_loaded", "first_call"),
+    ("first call", "spawned", "first_call"),
+)
+
+def measure(task: str, config_file: str) -> dict:
+    """Runs the probe once and returns the time of each step, in seconds."""
+    spawned = time.time()
+    result = subprocess.run([sys.executable, "-c", PROBE.format(base=str(BASE_PATH)), task, config_file],
+                            capture_output=True, text=True, check=True)
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+    marks["spawned"] = spawned
+    return {name: marks[end] - marks[start] for name, start, end in STEPS}
+
+def measure_binary(binary: str) -> float:
+    """Returns how long the frozen build takes to print its help and exit, in seconds."""
+    started = time.monotonic()
+    subprocess.run([binary, "--help"], capture_output=True, check=True)
+    return time.monotonic() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of simpleagent.")
+    parser.add_argument("tasks", nargs='*', default=list(PLUGINS), help="Tasks to start (default: all)")
+    parser.add_argument("--runs", type=int, default=5, help="Starts per task, the median is reported (default: 5)")
+    parser.add_argument("--binary", default=str(DEFAULT_BINARY),
+                        help="Frozen build to measure as well, if it exists (default: dist/simpleagent)")
+    parser.add_argument("--config", default=str(BASE_PATH / "sample_config.yaml"),
+                        help="Config file to start with (default: sample_config.yaml)")
+    parser.add_argument("--output", help="Also save the results as JSON to this file")
+    args = parser.parse_args()
+    runs = max(1, args.runs)
+
+    columns = [name for name, _, _ in STEPS]
+    print(f"{'Build':<7} | {'Task':<18} | " + " | ".join(f"{c:>13}" for c in columns))
+    print("-" * (30 + 16 * len(columns)))
+    results = []
+    for task in args.tasks:
+        if task not in PLUGINS:
+            print(f"{'script':<7} | {task:<18} | failed: unknown task")
+            continue
+        try:
+            timings = [measure(task, args.config) for _ in range(runs)]
+        except subprocess.CalledProcessError as e:
+            output = (e.stdout + e.stderr).strip().splitlines()
+            print(f"{'script':<7} | {task:<18} | failed: {output[-1] if output else e}")
+            continue
+        median = {c: statistics.median(timing[c] for timing in timings) for c in columns}
+        results.append({"build": "script", "task": task, "runs": runs, "median_seconds": median})
+        print(f"{'script':<7} | {task:<18} | " + " | ".join(f"{median[c] * 1000:>11.0f}ms" for c in columns))
+
+    if Path(args.binary).is_file():
+        try:
+            median = statistics.median(measure_binary(args.binary) for _ in range(runs))
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"\nFrozen build {args.binary} failed to start: {e}")
+        else:
+            results.append({"build": "frozen", "task": "--help", "runs": runs, "median_seconds": {"startup": median}})
+            print(f"\nFrozen build {args.binary}: {median * 1000:.0f}ms until '--help' exits")
+    else:
+        print(f"\nNo frozen build at {args.binary}, measured the script only.")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
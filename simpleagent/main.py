@@ -4,23 +4,27 @@ import yaml
 import sys
 from pathlib import Path
 import asyncio
-import inspect
-import os
+import importlib
 from dotenv import dotenv_values
 
-# --- Direct Plugin Imports ---
-# By importing plugins directly, we make them explicitly visible to PyInstaller's
-# static analysis, which is the most reliable way to ensure they are included
-# in the final executable.
-from plugins import daily_motivation, log_summarizer, bluetooth_tracker
-
 # --- Plugin Registry ---
-# Map command-line task names to their corresponding plugin modules.
-PLUGINS = {"daily_motivation": daily_motivation, "log_summarizer": log_summarizer, "bluetooth_tracker": bluetooth_tracker}
+# Map command-line task names to the modules of their plugins. A plugin is only
+# imported when its task runs, so e.g. a log summary doesn't load bleak.
+# PyInstaller can't see these imports, so simpleagent.spec bundles everything
+# in plugins/ as hidden imports.
+PLUGINS = {
+    "daily_motivation": "plugins.daily_motivation",
+    "log_summarizer": "plugins.log_summarizer",
+    "bluetooth_tracker": "plugins.bluetooth_tracker",
+}
 
-def load_configuration(config_file=None):
+def load_plugin(task_name: str):
+    """Imports and returns the plugin module of a task."""
+    return importlib.import_module(PLUGINS[task_name])
+
+def find_config_files(config_file=None):
     """
-    Loads config from .env and config.yaml, prioritizing an explicit path if provided.
+    Returns the paths of config.yaml and .env, prioritizing an explicit path if provided.
     If no path is given, it searches for files next to the executable (if frozen)
     or script, falling back to bundled files.
     """
@@ -41,10 +45,7 @@ def load_configuration(config_file=None):
         if not yaml_path.exists():
             yaml_path = bundled_path / "config.yaml"
  
-    with open(yaml_path, "r") as f:
-        config = yaml.safe_load(f)
- 
-    # Find and load .env
+    # Find .env
     if config_file:
         # Look for .env in the same directory as the specified config file
         env_path = Path(config_file).parent / ".env"
@@ -52,6 +53,13 @@ def load_configuration(config_file=None):
         env_path = base_path / ".env"
         if not env_path.exists():
             env_path = bundled_path / ".env"
+    return yaml_path, env_path
+
+def load_configuration(config_file=None):
+    """Loads config from .env and config.yaml, see find_config_files."""
+    yaml_path, env_path = find_config_files(config_file)
+    with open(yaml_path, "r") as f:
+        config = yaml.safe_load(f)
  
     # dotenv_values won't fail if the file is missing
     env_config = dotenv_values(dotenv_path=env_path)
@@ -62,8 +70,11 @@ def load_configuration(config_file=None):
 
 def main():
     parser = argparse.ArgumentParser(description="A modular CLI tool powered by Ollama.")
-    parser.add_argument("task", help="The name of the task to run (e.g., daily_motivation).")
+    parser.add_argument("tasks", nargs='+', metavar="task",
+                        help="The names of the tasks to run concurrently (e.g., daily_motivation), or 'serve' to run tasks on their schedules.")
     parser.add_argument("-c", "--config", help="Path to the configuration file (config.yaml).")
+    parser.add_argument("--timeout", type=float, metavar="MINUTES",
+                        help="Stop waiting for a task after this many minutes, unless its config sets 'timeout_minutes'.")
  
     args = parser.parse_args()
     try:
@@ -72,23 +83,41 @@ def main():
         print("Error: config.yaml not found. Please provide a path with --config or place it in the application's directory.")
         sys.exit(1)
  
-    task_name = args.task
- 
-    # Find and run the plugin from the registry
-    plugin_module = PLUGINS.get(task_name)
+    task_names = list(dict.fromkeys(args.tasks))
 
-    if not plugin_module:
-        print(f"Error: Plugin '{task_name}' not found. Available plugins are: {list(PLUGINS.keys())}")
+    if "serve" in task_names:
+        if len(task_names) > 1:
+            print("Error: 'serve' runs the scheduled tasks and can't be combined with other tasks.")
+            sys.exit(1)
+        from modules.scheduler import Scheduler
+        scheduler = Scheduler(PLUGINS, load_plugin, lambda: load_configuration(args.config), find_config_files(args.config))
+        try:
+            asyncio.run(scheduler.serve())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Check the names before starting anything
+    unknown = [name for name in task_names if name not in PLUGINS]
+    if unknown:
+        print(f"Error: Plugin(s) {unknown} not found. Available plugins are: {list(PLUGINS.keys())}")
+        sys.exit(1)
+    if args.timeout is not None and args.timeout <= 0:
+        print("Error: --timeout must be greater than 0.")
         sys.exit(1)
 
+    # Run all tasks in one event loop, each with its own timeout; a task that
+    # fails is reported without stopping the others
+    from modules.task_runner import run_tasks, format_report
+    default_timeout = args.timeout * 60 if args.timeout is not None else None
     try:
-        # Check if the run function is a coroutine and run it accordingly
-        if inspect.iscoroutinefunction(plugin_module.run):
-            asyncio.run(plugin_module.run(config))
-        else:
-            plugin_module.run(config)
-    except Exception as e:
-        print(f"An error occurred while running task '{task_name}': {e}")
+        outcomes = asyncio.run(run_tasks(task_names, load_plugin, config, default_timeout))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+    if len(outcomes) > 1:
+        print("\n" + format_report(outcomes))
+    if any(outcome['status'] != 'ok' for outcome in outcomes):
         sys.exit(1)
 
 if __name__ == "__main__":
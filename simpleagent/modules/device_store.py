@@ -0,0 +1,222 @@
+# modules/device_store.py
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+
+def fingerprint_id(manufacturer_ids, service_uuids) -> str:
+    """
+    Returns the compact ID of a device fingerprint: a 64-bit digest of its
+    sorted manufacturer IDs and service UUIDs, as 16 hex characters. IDs are
+    interned, so every copy of the same ID shares one string.
+    """
+    key = ",".join(str(i) for i in sorted(manufacturer_ids)) + "|" + ",".join(sorted(service_uuids))
+    return sys.intern(hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest())
+
+def _timestamp(value) -> int:
+    """Reads an address time, stored as a Unix timestamp or, by older versions, as ISO text."""
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp())
+
+class DeviceRecord:
+    """
+    A learned device. Slots keep records small when thousands of devices are
+    tracked. 'addresses' maps each MAC address seen with this fingerprint to
+    when it was last seen, in whole seconds since the epoch; the other times
+    are ISO text. 'presence' is a bitmap of the time buckets in which the
+    device was seen, as of bucket 'presence_bucket' (see PresenceModel).
+    """
+    __slots__ = ('name', 'seen_count', 'first_seen', 'last_seen', 'is_regular', 'last_rssi', 'last_alerted',
+                 'presence', 'presence_bucket', 'addresses')
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, name: str, first_seen: str, last_rssi: int = None, seen_count: int = 0, last_seen: str = None,
+                 is_regular: bool = False, last_alerted: str = None, presence: int = 0, presence_bucket: int = None,
+                 addresses: dict = None):
+        self.name = name
+        self.first_seen = first_seen
+        self.last_rssi = last_rssi
+        self.seen_count = seen_count
+        self.last_seen = last_seen
+        self.is_regular = is_regular
+        self.last_alerted = last_alerted
+        self.presence = presence
+        self.presence_bucket = presence_bucket
+        self.addresses = addresses if addresses is not None else {}
+
+    def to_data(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_data(cls, data: dict, addresses: dict = None):
+        """Builds a record from saved data, ignoring fields that older versions kept."""
+        return cls(addresses=addresses, **{field: data[field] for field in cls.FIELDS if field in data})
+
+class DeviceStore:
+    """
+    SQLite storage for the bluetooth_tracker knowledge base: a dictionary of
+    top-level state, with 'devices' mapping fingerprint IDs to DeviceRecords.
+    Each save writes only the devices that changed, in one transaction,
+    instead of rewriting everything. The addresses of a device are kept in
+    their own table, and only addresses that are new, were seen again or
+    were evicted are written.
+    """
+    def __init__(self, path):
+        self.path = Path(path).expanduser()
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS devices (
+                fingerprint TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS addresses (
+                fingerprint TEXT NOT NULL,
+                address TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                PRIMARY KEY (fingerprint, address)
+            );
+        """)
+        self._saved_addresses = {}   # fingerprint -> {address: last seen}, as on disk
+
+    @staticmethod
+    def _record(fingerprint: str, data: dict, addresses: dict):
+        """Returns the fingerprint ID and record of a saved device, upgrading older formats."""
+        if 'fingerprint_data' in data:
+            # Older versions keyed devices on str() of the fingerprint tuple
+            fingerprint_data = data['fingerprint_data']
+            fingerprint = fingerprint_id(fingerprint_data['manufacturer_data_keys'], fingerprint_data['service_uuids'])
+        else:
+            fingerprint = sys.intern(fingerprint)
+        addresses = {address: _timestamp(last_seen) for address, last_seen in addresses.items()}
+        return fingerprint, DeviceRecord.from_data(data, addresses)
+
+    def load(self):
+        """Returns the knowledge base, or None if nothing has been saved yet."""
+        state = {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM state")}
+        if not state:
+            return None
+        rows = {fingerprint: (json.loads(data), {}) for fingerprint, data in self._conn.execute("SELECT fingerprint, data FROM devices")}
+        for fingerprint, address, last_seen in self._conn.execute("SELECT fingerprint, address, last_seen FROM addresses"):
+            if fingerprint in rows:
+                rows[fingerprint][1][address] = last_seen
+        self._saved_addresses = {}
+
+        devices = {}
+        needs_upgrade = False
+        for fingerprint, (data, addresses) in rows.items():
+            new_fingerprint, record = self._record(fingerprint, data, addresses)
+            # Times stored as text by older versions don't compare equal, so they get rewritten
+            self._saved_addresses[fingerprint] = {address: int(value) if value.isdigit() else value
+                                                  for address, value in addresses.items()}
+            needs_upgrade = needs_upgrade or new_fingerprint != fingerprint or record.addresses != self._saved_addresses[fingerprint]
+            devices[new_fingerprint] = record
+        state['devices'] = devices
+        if needs_upgrade:
+            # Rewrite everything once in the current format
+            self.save(state)
+        return state
+
+    def save(self, kb: dict, fingerprints=None):
+        """
+        Saves the top-level state and the given devices, or all devices if
+        fingerprints is None. A fingerprint no longer in the knowledge base is
+        deleted.
+        """
+        if fingerprints is None:
+            fingerprints = set(kb['devices']) | set(self._saved_addresses)
+        saved_addresses = {}
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                                   [(key, json.dumps(value)) for key, value in kb.items() if key != 'devices'])
+            for fingerprint in fingerprints:
+                device = kb['devices'].get(fingerprint)
+                if device is None:
+                    self._conn.execute("DELETE FROM devices WHERE fingerprint = ?", (fingerprint,))
+                    self._conn.execute("DELETE FROM addresses WHERE fingerprint = ?", (fingerprint,))
+                    saved_addresses[fingerprint] = None
+                    continue
+
+                self._conn.execute("INSERT OR REPLACE INTO devices (fingerprint, data) VALUES (?, ?)",
+                                   (fingerprint, json.dumps(device.to_data())))
+                addresses = device.addresses
+                on_disk = self._saved_addresses.get(fingerprint, {})
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO addresses (fingerprint, address, last_seen) VALUES (?, ?, ?)",
+                    [(fingerprint, address, last_seen) for address, last_seen in addresses.items()
+                     if on_disk.get(address) != last_seen])
+                self._conn.executemany("DELETE FROM addresses WHERE fingerprint = ? AND address = ?",
+                                       [(fingerprint, address) for address in on_disk if address not in addresses])
+                saved_addresses[fingerprint] = dict(addresses)
+
+        # Only remember what was written once the transaction went through
+        for fingerprint, addresses in saved_addresses.items():
+            if addresses is None:
+                self._saved_addresses.pop(fingerprint, None)
+            else:
+                self._saved_addresses[fingerprint] = addresses
+
+    def migrate_json(self, json_file) -> bool:
+        """
+        Imports a knowledge base from the old JSON format, if the store is
+        still empty. The JSON file is renamed afterwards, so this happens once.
+        Returns whether anything was imported.
+        """
+        json_path = Path(json_file).expanduser()
+        if not json_path.exists() or self._conn.execute("SELECT 1 FROM state LIMIT 1").fetchone():
+            return False
+        try:
+            with open(json_path, 'r') as f:
+                kb = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Could not read the old knowledge base {json_path}, not migrating it: {e}")
+            return False
+        kb['devices'] = dict(self._record(fingerprint, data, data.get('addresses', {}))
+                             for fingerprint, data in kb['devices'].items())
+        self.save(kb)
+        os.replace(json_path, json_path.with_name(json_path.name + ".migrated"))
+        print(f"Migrated {len(kb['devices'])} devices from {json_path} to {self.path}.")
+        return True
+
+    def close(self):
+        self._conn.close()
+
+def knowledge_base_paths(kb_file) -> tuple:
+    """
+    Returns the SQLite and the old JSON path of the knowledge base in the
+    config. A '.json' path, as in older configs, is stored next to it as '.sqlite'.
+    """
+    path = Path(kb_file).expanduser()
+    return path.with_suffix('.sqlite'), path.with_suffix('.json')
+
+def open_knowledge_base(kb_file) -> DeviceStore:
+    """Opens the SQLite knowledge base, migrating an existing JSON knowledge base into it on first use."""
+    sqlite_path, json_path = knowledge_base_paths(kb_file)
+    store = DeviceStore(sqlite_path)
+    store.migrate_json(json_path)
+    return store
+
+def read_device_names(kb_file) -> dict:
+    """
+    Returns the name of every saved device by fingerprint ID. The SQLite
+    knowledge base is opened read-only, so nothing is created or migrated
+    behind the tracker's back; an empty dictionary is returned if it doesn't
+    exist yet, e.g. while only an old JSON knowledge base is there.
+    """
+    sqlite_path, _ = knowledge_base_paths(kb_file)
+    if not sqlite_path.exists():
+        return {}
+    conn = sqlite3.connect(f"{sqlite_path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        return {fingerprint: json.loads(data).get('name')
+                for fingerprint, data in conn.execute("SELECT fingerprint, data FROM devices")}
+    finally:
+        conn.close()
@@ -0,0 +1,83 @@
+# modules/embedding_store.py
+import hashlib
+import math
+import sqlite3
+import threading
+from array import array
+from operator import mul
+from pathlib import Path
+
+DEFAULT_EMBEDDING_FILE = Path.home() / ".simpleagent_embeddings.sqlite"
+
+def normalize(vector) -> array:
+    """Scales a vector to unit length, so cosine similarity becomes a plain dot product."""
+    norm = math.hypot(*vector) or 1.0
+    return array('f', (x / norm for x in vector))
+
+def cosine_similarities(vector: array, vectors: list) -> list:
+    """
+    Returns the cosine similarity of a normalized vector with each of a list of
+    normalized vectors. The dot products run in C through map(), which is fast
+    enough for thousands of vectors without needing numpy.
+    """
+    return [sum(map(mul, vector, other)) for other in vectors]
+
+class EmbeddingStore:
+    """
+    On-disk store of normalized embedding vectors, keyed on the embedding model
+    and the text, so each text only has to be embedded once.
+    """
+    def __init__(self, path=None):
+        self.path = Path(path or DEFAULT_EMBEDDING_FILE).expanduser()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_model ON embeddings (model)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, texts: list) -> dict:
+        """Returns the stored vectors of those texts that have one, as {text: vector}."""
+        wanted = {self._key(model, text): text for text in texts}
+        found = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT key, vector FROM embeddings WHERE model = ?", (model,))
+            for key, blob in rows:
+                if key in wanted:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[wanted[key]] = vector
+        return found
+
+    def put_many(self, model: str, vectors: dict):
+        """Stores {text: vector}, normalizing the vectors first. Returns the normalized vectors."""
+        normalized = {text: normalize(vector) for text, vector in vectors.items()}
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                [(self._key(model, text), model, vector.tobytes()) for text, vector in normalized.items()],
+            )
+            self._conn.commit()
+        return normalized
+
+    def prune(self, model: str, keep_texts: list):
+        """Deletes the vectors of the model's texts that are not in keep_texts."""
+        keep = {self._key(model, text) for text in keep_texts}
+        with self._lock:
+            stale = [(key,) for (key,) in self._conn.execute("SELECT key FROM embeddings WHERE model = ?", (model,))
+                     if key not in keep]
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,118 @@
+# modules/log_compressor.py
+import re
+
+# Values that change from line to line, masked so repeated messages share one template.
+# Alternatives are tried left to right, so longer forms come before their parts. The
+# lookahead lets the regex engine skip quickly over text that can't start a value.
+VARIABLE_PATTERN = re.compile(
+    r"\b(?=[0-9a-fA-FJMASOND])(?:"
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"  # UUIDs
+    r"|\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?)?"  # ISO dates and timestamps
+    r"|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}\b"  # syslog timestamps
+    r"|\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b"                                           # times
+    r"|[0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5}\b"                                        # MAC addresses
+    r"|\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"                                            # IPv4 addresses
+    r"|0x[0-9a-fA-F]+\b"                                                              # hex numbers
+    r"|(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b"                                           # hashes and hex IDs
+    r"|\d+(?:\.\d+)?"                                                                 # numbers, also before a unit
+    r")"
+)
+MASK = "<*>"
+
+# Lines that are kept word for word, because their details usually matter
+SEVERE_PATTERN = re.compile(
+    r"\b(?:emerg|alert|crit(?:ical)?|fatal|err(?:or)?|exception|traceback|panic|fail(?:ed|ure)?|warn(?:ing)?)\b",
+    re.IGNORECASE,
+)
+
+DEFAULT_MAX_TEMPLATES = 5000
+DEFAULT_MAX_VERBATIM_LINES = 500
+DEFAULT_MAX_COPIES_PER_MESSAGE = 3
+
+def mask_line(line: str) -> str:
+    """Replaces the variable parts of a log line with <*> and normalizes whitespace."""
+    return " ".join(VARIABLE_PATTERN.sub(MASK, line).split())
+
+class LogCompressor:
+    """
+    Condenses log lines before they are sent to a model.
+
+    Lines are masked into templates (see mask_line) and counted, so thousands of
+    lines that differ only in timestamps, IDs or numbers become one line with a
+    count. Error and warning lines are kept verbatim and in order instead. A run
+    of the same error is collapsed into one line, and once an error has been
+    kept 'max_copies_per_message' times, later occurrences are only counted.
+    Memory use is bounded by 'max_templates' and 'max_verbatim_lines'; lines
+    beyond those limits are only counted.
+    """
+    def __init__(self, max_templates: int = DEFAULT_MAX_TEMPLATES,
+                 max_verbatim_lines: int = DEFAULT_MAX_VERBATIM_LINES,
+                 max_copies_per_message: int = DEFAULT_MAX_COPIES_PER_MESSAGE):
+        self.max_templates = max_templates
+        self.max_verbatim_lines = max_verbatim_lines
+        self.max_copies_per_message = max_copies_per_message
+        # template -> [count, first line seen]; dicts keep the order of first appearance
+        self.templates = {}
+        # [line, repeats] for each error and warning line that is kept
+        self.verbatim = []
+        # template -> [index of its latest kept line, number of lines kept]
+        self._verbatim_templates = {}
+        self._previous_template = None
+        self.omitted_lines = 0
+        self.input_lines = 0
+        self.input_chars = 0
+
+    def add(self, line: str):
+        line = line.rstrip("\r\n")
+        self.input_lines += 1
+        self.input_chars += len(line) + 1
+        if not line.strip():
+            return
+
+        template = mask_line(line)
+        previous_template, self._previous_template = self._previous_template, template
+        if SEVERE_PATTERN.search(line):
+            kept = self._verbatim_templates.get(template)
+            if kept and (template == previous_template or kept[1] >= self.max_copies_per_message):
+                self.verbatim[kept[0]][1] += 1
+                return
+            if len(self.verbatim) < self.max_verbatim_lines:
+                if kept:
+                    kept[0] = len(self.verbatim)
+                    kept[1] += 1
+                else:
+                    self._verbatim_templates[template] = [len(self.verbatim), 1]
+                self.verbatim.append([line, 0])
+                return
+
+        entry = self.templates.get(template)
+        if entry is not None:
+            entry[0] += 1
+        elif len(self.templates) < self.max_templates:
+            self.templates[template] = [1, line]
+        else:
+            self.omitted_lines += 1
+
+    def add_lines(self, lines):
+        for line in lines:
+            self.add(line)
+
+    def render_lines(self):
+        """Yields the compressed log, one line at a time."""
+        yield (f"[Compressed log: {self.input_lines} lines reduced to {len(self.verbatim)} error/warning "
+               f"lines and {len(self.templates)} message templates. In templates, {MASK} stands for a "
+               f"value such as a number, ID or timestamp.]\n")
+        if self.verbatim:
+            yield "\nERRORS AND WARNINGS (verbatim, in order):\n"
+            for line, repeats in self.verbatim:
+                yield f"{line}  [similar line repeated {repeats} more times]\n" if repeats else f"{line}\n"
+        if self.templates:
+            yield "\nOTHER MESSAGES (times seen, then message; in order of first appearance):\n"
+            for template, (count, first_line) in self.templates.items():
+                # A message seen once is more useful with its values
+                yield f"{count}x {template}\n" if count > 1 else f"1x {first_line}\n"
+        if self.omitted_lines:
+            yield f"\n[{self.omitted_lines} lines with rarer messages were left out.]\n"
+
+    def render(self) -> str:
+        return "".join(self.render_lines())
@@ -1,9 +1,220 @@
 # modules/notifier.py
-import os
+import atexit
 import smtplib
+import sqlite3
+import threading
+import time
 import requests
 from email.message import EmailMessage
 from typing import List
+from modules.outbox import Outbox
+
+# Defaults for the optional 'notifications' section of config.yaml
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_RETRY_BACKOFF_SECONDS = 30   # retries wait 30s, 60s, 120s, ... up to an hour
+MAX_RETRY_BACKOFF_SECONDS = 3600
+DEFAULT_FLUSH_TIMEOUT_SECONDS = 30   # how long a run waits at exit for its notifications
+DEFAULT_SMTP_IDLE_SECONDS = 60       # an unused SMTP connection is closed after this long
+
+NTFY_TIMEOUT = 10    # seconds
+SMTP_TIMEOUT = 30    # seconds
+CHANNELS = ('ntfy', 'email')
+# Workers look at the outbox at least this often, for rows left by other processes
+POLL_SECONDS = 60
+
+# One dispatcher per outbox file, shared by every Notifier in the process
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+def _notification_settings(config: dict) -> dict:
+    return config.get('notifications') or {}
+
+class Dispatcher:
+    """
+    Delivers the notifications in an outbox from background threads, one per
+    channel, so a slow mail server doesn't hold up ntfy. ntfy requests share
+    a keep-alive session, and the SMTP connection stays open between emails
+    until it has been idle for 'smtp_idle_seconds'. A failed delivery is
+    retried with exponential backoff, and dropped after 'max_attempts'.
+    Notifications still waiting when the process exits stay in the outbox
+    and are delivered by the next run.
+    """
+    def __init__(self, outbox: Outbox, config: dict):
+        self.outbox = outbox
+        self._lock = threading.Lock()
+        self._busy = set()   # channels in the middle of a delivery
+        self._wake = {channel: threading.Event() for channel in CHANNELS}
+        self._stopped = threading.Event()
+        self._session = requests.Session()
+        self._smtp = None
+        self._smtp_settings = None
+        self._smtp_used_at = 0.0
+        self.configure(config)
+        self._threads = [threading.Thread(target=self._work, args=(channel,), name=f"notifier-{channel}", daemon=True)
+                         for channel in CHANNELS]
+        for thread in self._threads:
+            thread.start()
+
+    def configure(self, config: dict):
+        """Uses the settings and credentials of a newly loaded config for the next deliveries."""
+        settings = _notification_settings(config)
+        with self._lock:
+            self.config = config
+            self.max_attempts = int(settings.get('max_attempts', DEFAULT_MAX_ATTEMPTS))
+            self.backoff = float(settings.get('retry_backoff_seconds', DEFAULT_RETRY_BACKOFF_SECONDS))
+            self.flush_timeout = float(settings.get('flush_timeout_seconds', DEFAULT_FLUSH_TIMEOUT_SECONDS))
+            self.smtp_idle = float(settings.get('smtp_idle_seconds', DEFAULT_SMTP_IDLE_SECONDS))
+
+    def queue(self, channel: str, destinations: List[str], message: str):
+        try:
+            self.outbox.add(channel, destinations, message)
+        except sqlite3.Error as e:
+            print(f"Error queueing {channel} notification: {e}")
+            return
+        self._wake[channel].set()
+
+    def _work(self, channel: str):
+        deliver = self._deliver_ntfy if channel == 'ntfy' else self._deliver_email
+        wake = self._wake[channel]
+        while not self._stopped.is_set():
+            wake.clear()
+            with self._lock:
+                self._busy.add(channel)
+            try:
+                for notification_id, destination, message, attempts in self.outbox.claim_due(channel):
+                    try:
+                        deliver(destination, message)
+                    except Exception as e:
+                        self._failed(channel, notification_id, destination, attempts + 1, e)
+                    else:
+                        self.outbox.remove(notification_id)
+                wait = self.outbox.seconds_until_due(channel)
+            except sqlite3.Error as e:
+                print(f"Error reading the notification outbox: {e}")
+                wait = None
+            finally:
+                with self._lock:
+                    self._busy.discard(channel)
+
+            wait = POLL_SECONDS if wait is None else min(wait, POLL_SECONDS)
+            if channel == 'email' and self._smtp is not None:
+                idle_left = self._smtp_used_at + self.smtp_idle - time.monotonic()
+                if idle_left <= 0:
+                    self._close_smtp()
+                else:
+                    wait = min(wait, idle_left)
+            wake.wait(wait)
+        if channel == 'email':
+            self._close_smtp()
+
+    def _failed(self, channel: str, notification_id: int, destination: str, attempts: int, error: Exception):
+        if attempts >= self.max_attempts:
+            print(f"Error sending {channel} notification to {destination}, giving up after {attempts} attempts: {error}")
+            self.outbox.remove(notification_id)
+            return
+        delay = min(self.backoff * 2 ** (attempts - 1), MAX_RETRY_BACKOFF_SECONDS)
+        print(f"Error sending {channel} notification to {destination}, retrying in {delay:g}s: {error}")
+        self.outbox.retry_later(notification_id, attempts, delay, str(error))
+
+    def _deliver_ntfy(self, ntfy_server: str, message: str):
+        response = self._session.post(ntfy_server, data=message.encode('utf-8'), timeout=NTFY_TIMEOUT)
+        response.raise_for_status()
+        print("ntfy notification sent.")
+
+    def _connect_smtp(self):
+        email_host = self.config.get("EMAIL_HOST")
+        email_port = int(self.config.get("EMAIL_PORT", 587))
+        email_user = self.config.get("EMAIL_USER")
+        email_password = self.config.get("EMAIL_PASSWORD")
+        if not all([email_host, email_user, email_password]):
+            raise smtplib.SMTPException("email credentials not fully configured in .env")
+
+        settings = (email_host, email_port, email_user, email_password)
+        if self._smtp is not None and settings == self._smtp_settings:
+            return self._smtp
+        self._close_smtp()
+        server = smtplib.SMTP(email_host, email_port, timeout=SMTP_TIMEOUT)
+        try:
+            server.starttls()
+            server.login(email_user, email_password)
+        except BaseException:
+            server.close()
+            raise
+        self._smtp, self._smtp_settings = server, settings
+        return server
+
+    def _close_smtp(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except OSError:
+            self._smtp.close()
+        self._smtp = None
+
+    def _deliver_email(self, recipient: str, message: str):
+        msg = EmailMessage()
+        msg.set_content(message)
+        msg['From'] = self.config.get("EMAIL_USER")
+        msg['To'] = recipient
+        reused = self._smtp is not None
+        try:
+            self._connect_smtp().send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            if not reused:
+                raise
+            # The server dropped the connection while it was idle, so reconnect once
+            self._close_smtp()
+            self._connect_smtp().send_message(msg)
+        self._smtp_used_at = time.monotonic()
+        print(f"Email notification sent to {recipient}.")
+
+    def flush(self, timeout: float):
+        """Waits until every notification that is due has been attempted, or until the timeout."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                busy = bool(self._busy)
+            if not busy and self.outbox.count(due_only=True) == 0:
+                return
+            time.sleep(0.05)
+
+    def close(self):
+        try:
+            self.flush(self.flush_timeout)
+            waiting = self.outbox.count()
+        except sqlite3.Error:
+            waiting = 0
+        self._stopped.set()
+        for event in self._wake.values():
+            event.set()
+        for thread in self._threads:
+            thread.join(timeout=SMTP_TIMEOUT)
+        self._session.close()
+        self.outbox.close()
+        if waiting:
+            print(f"{waiting} notification(s) could not be sent yet and will be retried on the next run.")
+
+def get_dispatcher(config: dict) -> Dispatcher:
+    """
+    Returns the dispatcher of the outbox in the config, starting it on first
+    use. It is closed when the process exits, after a last chance of up to
+    'flush_timeout_seconds' to deliver what is due.
+    """
+    outbox_file = _notification_settings(config).get('outbox_file')
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(outbox_file)
+        if dispatcher is None:
+            try:
+                outbox = Outbox(outbox_file)
+            except sqlite3.Error as e:
+                print(f"Warning: Could not open the notification outbox, failed notifications won't be kept: {e}")
+                outbox = Outbox(":memory:")
+            dispatcher = _dispatchers[outbox_file] = Dispatcher(outbox, config)
+            atexit.register(dispatcher.close)
+        else:
+            dispatcher.configure(config)
+    return dispatcher
 
 class Notifier:
     def __init__(self, config: dict):
@@ -16,6 +227,10 @@ class Notifier:
         self.config = config
 
     def send(self, message: str, **kwargs):
+        """
+        Queues the message for each preferred channel and returns right away;
+        it is delivered in the background, see Dispatcher.
+        """
         sent_at_least_once = False
         if 'ntfy' in self.preferences:
             self._send_ntfy(message)
@@ -33,11 +248,7 @@ class Notifier:
         if not ntfy_server:
             print("Error: NTFY_SERVER not configured in .env for ntfy notification.")
             return
-        try:
-            requests.post(ntfy_server, data=message.encode('utf-8'))
-            print("ntfy notification sent.")
-        except requests.exceptions.RequestException as e:
-            print(f"Error sending ntfy notification: {e}")
+        get_dispatcher(self.config).queue('ntfy', [ntfy_server], message)
 
     def _send_email(self, message: str, **kwargs):
         numbers_str = self.config.get('TARGET_PHONE_NUMBERS', '')
@@ -46,28 +257,7 @@ class Notifier:
             print("Error: Target phone numbers not provided for email notification.")
             return
 
-        email_host = self.config.get("EMAIL_HOST")
-        email_port = int(self.config.get("EMAIL_PORT", 587))
-        email_user = self.config.get("EMAIL_USER")
-        email_password = self.config.get("EMAIL_PASSWORD")
-
-        if not all([email_host, email_user, email_password]):
+        if not all([self.config.get("EMAIL_HOST"), self.config.get("EMAIL_USER"), self.config.get("EMAIL_PASSWORD")]):
             print("Error: Email credentials not fully configured in .env")
             return
-
-        try:
-            with smtplib.SMTP(email_host, email_port) as server:
-                server.starttls()
-                server.login(email_user, email_password)
-                for recipient in target_phone_numbers:
-                    recipient = recipient.strip()
-                    if not recipient:
-                        continue
-                    msg = EmailMessage()
-                    msg.set_content(message)
-                    msg['From'] = email_user
-                    msg['To'] = recipient
-                    server.send_message(msg)
-                    print(f"Email notification sent to {recipient}.")
-        except smtplib.SMTPException as e:
-            print(f"Error sending email: {e}")
+        get_dispatcher(self.config).queue('email', target_phone_numbers, message)
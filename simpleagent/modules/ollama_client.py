@@ -1,50 +1,469 @@
 # modules/ollama_client.py
 import os
+import asyncio
 import requests
 import json
+import time
+import threading
+from contextlib import contextmanager, asynccontextmanager
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from modules.response_cache import ResponseCache
+from modules.ollama_metrics import MetricsLog, new_metrics, add_server_metrics
+
+# Defaults for the optional 'ollama' section of config.yaml
+DEFAULT_CONNECT_TIMEOUT = 5      # seconds to establish a connection
+DEFAULT_READ_TIMEOUT = 300       # seconds to wait for the model between bytes of the response
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5     # retries wait 0.5s, 1s, 2s, ...
+DEFAULT_MAX_CONNECTIONS = 4
+
+# Responses worth retrying: rate limiting and transient server/proxy errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+def _client_settings(config: dict) -> dict:
+    """Reads connection settings from the optional 'ollama' section of the config."""
+    ollama_config = config.get('ollama') or {}
+    return {
+        "connect_timeout": float(ollama_config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+        "read_timeout": float(ollama_config.get('read_timeout', DEFAULT_READ_TIMEOUT)),
+        "max_retries": int(ollama_config.get('max_retries', DEFAULT_MAX_RETRIES)),
+        "backoff_factor": float(ollama_config.get('backoff_factor', DEFAULT_BACKOFF_FACTOR)),
+        "max_connections": int(ollama_config.get('max_connections', DEFAULT_MAX_CONNECTIONS)),
+    }
+
+def _build_payload(model: str, prompt: str, system: str = None, stream: bool = False) -> dict:
+    """Builds the /api/generate request body, prefixing the system prompt with the current time."""
+    # Get current time and create the time-aware instruction
+    current_time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S %Z')
+    time_instruction = f"The current time is - {current_time_str}."
+
+    # Combine the time instruction with any provided system prompt
+    if system:
+        final_system_prompt = f"{time_instruction}\n\n{system}"
+    else:
+        final_system_prompt = time_instruction
+
+    return {
+        "model": model,
+        "prompt": prompt,
+        "stream": stream,
+        "system": final_system_prompt
+    }
+
+def _parse_response(text: str):
+    """Extracts the generated text and the final response object from an Ollama response body."""
+    # The response from Ollama is a JSON string per line, we'll parse the last one
+    lines = text.strip().split('\n')
+    last_line = json.loads(lines[-1])
+    return last_line.get('response', 'No response content found.'), last_line
+
+def _is_error(response: str) -> bool:
+    """Error results are returned as text, and must never be cached."""
+    return response.startswith("Error")
+
+def _failed(metrics: dict, error: str) -> str:
+    """Records an error message in the call's metrics and returns it."""
+    metrics['error'] = error
+    return error
+
+def _parse_stream_line(line) -> dict:
+    """Parses one NDJSON line of a streamed response; blank keep-alive lines give an empty dict."""
+    line = line.strip()
+    return json.loads(line) if line else {}
 
 class OllamaClient:
+    """
+    Synchronous Ollama client. Requests go through a pooled keep-alive session,
+    so repeated calls reuse the same TCP connection, and connection failures and
+    transient server errors are retried with exponential backoff.
+    """
     def __init__(self, config: dict):
         self.server_address = config.get("OLLAMA_SERVER_ADDRESS")
         if not self.server_address:
             raise ValueError("OLLAMA_SERVER_ADDRESS not found in .env file")
 
-    def generate(self, model: str, prompt: str, system: str = None):
+        settings = _client_settings(config)
+        self.timeout = (settings['connect_timeout'], settings['read_timeout'])
+
+        # A read timeout means the model is busy; retrying would only queue the same work again
+        retry = Retry(
+            total=settings['max_retries'],
+            read=0,
+            backoff_factor=settings['backoff_factor'],
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings['max_connections'], max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Optional on-disk cache of responses, see ResponseCache
+        self.cache = ResponseCache.from_config(config)
+
+        # Timings and token counts of the most recent call, see new_metrics
+        self.last_metrics = new_metrics(None)
+        self.metrics_log = MetricsLog.from_config(config)
+
+    def generate(self, model: str, prompt: str, system: str = None, use_cache: bool = True):
         """
         Sends a prompt to the Ollama server and gets a response.
+        If the response cache is enabled, a cached response is returned when
+        available; pass use_cache=False to always ask the model.
         """
         if not self.server_address:
             return "Error: Ollama server address is not configured."
 
-        # Get current time and create the time-aware instruction
-        current_time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S %Z')
-        time_instruction = f"The current time is - {current_time_str}."
+        start = time.perf_counter()
+        metrics = new_metrics(model)
+        cache_key = self.cache.make_key(model, prompt, system) if self.cache and use_cache else None
+        try:
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    metrics['cached'] = True
+                    return cached
 
-        # Combine the time instruction with any provided system prompt
-        if system:
-            final_system_prompt = f"{time_instruction}\n\n{system}"
-        else:
-            final_system_prompt = time_instruction
+            url = f"{self.server_address}/api/generate"
+            payload = _build_payload(model, prompt, system)
+            http_start = time.perf_counter()
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            text = response.text
+            metrics['http_time'] = time.perf_counter() - http_start
+            result, final = _parse_response(text)
+            add_server_metrics(metrics, final)
+            if cache_key and not _is_error(result):
+                self.cache.put(cache_key, result)
+            return result
+
+        except requests.exceptions.RequestException as e:
+            return _failed(metrics, f"Error connecting to Ollama: {e}")
+        except json.JSONDecodeError:
+            return _failed(metrics, "Error: Could not decode the response from Ollama.")
+        finally:
+            self._record(metrics, start)
 
+    def generate_stream(self, model: str, prompt: str, system: str = None, use_cache: bool = True):
+        """
+        Sends a prompt to the Ollama server and yields the response text piece by
+        piece as the model produces it. On failure, an error message is yielded
+        instead. last_metrics is updated once the stream has been consumed.
+        A cached response is yielded in one piece.
+        """
+        start = time.perf_counter()
+        metrics = new_metrics(model)
+        cache_key = self.cache.make_key(model, prompt, system) if self.cache and use_cache else None
+        tokens = []
         try:
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    metrics['cached'] = True
+                    metrics['time_to_first_token'] = time.perf_counter() - start
+                    yield cached
+                    return
+
             url = f"{self.server_address}/api/generate"
-            payload = {
-                "model": model,
-                "prompt": prompt,
-                "stream": False,
-                "system": final_system_prompt
-            }
-            response = requests.post(url, json=payload)
+            payload = _build_payload(model, prompt, system, stream=True)
+            http_start = time.perf_counter()
+            with self.session.post(url, json=payload, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    chunk = _parse_stream_line(line)
+                    if 'error' in chunk:
+                        yield _failed(metrics, f"Error from Ollama: {chunk['error']}")
+                        return
+                    token = chunk.get('response')
+                    if token:
+                        if metrics['time_to_first_token'] is None:
+                            metrics['time_to_first_token'] = time.perf_counter() - start
+                        tokens.append(token)
+                        yield token
+                    if chunk.get('done'):
+                        metrics['http_time'] = time.perf_counter() - http_start
+                        add_server_metrics(metrics, chunk)
+                        if cache_key:
+                            self.cache.put(cache_key, "".join(tokens))
+                        return
+
+        except requests.exceptions.RequestException as e:
+            yield _failed(metrics, f"Error connecting to Ollama: {e}")
+        except json.JSONDecodeError:
+            yield _failed(metrics, "Error: Could not decode the response from Ollama.")
+        finally:
+            self._record(metrics, start)
+
+    def embed(self, model: str, texts: list):
+        """
+        Gets one embedding vector per text from the Ollama server, using an
+        embedding model such as 'nomic-embed-text'. Returns None on failure,
+        with the error in last_metrics.
+        """
+        start = time.perf_counter()
+        metrics = new_metrics(model)
+        try:
+            url = f"{self.server_address}/api/embed"
+            http_start = time.perf_counter()
+            response = self.session.post(url, json={"model": model, "input": texts}, timeout=self.timeout)
             response.raise_for_status()
-            
-            # The response from Ollama is a JSON string per line, we'll parse the last one
-            lines = response.text.strip().split('\n')
-            last_line = json.loads(lines[-1])
-            
-            return last_line.get('response', 'No response content found.')
+            body = response.json()
+            metrics['http_time'] = time.perf_counter() - http_start
+            add_server_metrics(metrics, body)
+            if 'error' in body:
+                _failed(metrics, f"Error from Ollama: {body['error']}")
+                return None
+            return body['embeddings']
 
         except requests.exceptions.RequestException as e:
-            return f"Error connecting to Ollama: {e}"
+            _failed(metrics, f"Error connecting to Ollama: {e}")
+        except (json.JSONDecodeError, KeyError):
+            _failed(metrics, "Error: Could not decode the response from Ollama.")
+        finally:
+            self._record(metrics, start)
+        return None
+
+    def _record(self, metrics: dict, start: float):
+        metrics['wall_time'] = time.perf_counter() - start
+        self.last_metrics = metrics
+        if self.metrics_log:
+            self.metrics_log.write(metrics)
+
+    def close(self):
+        """Closes the pooled connections and the response cache."""
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class AsyncOllamaClient:
+    """
+    asyncio Ollama client for running many generations concurrently against one
+    server. All calls share one aiohttp connection pool, limited to
+    'max_connections' open connections, and are retried with the same backoff
+    policy as OllamaClient. Use it as an async context manager, or call close().
+    """
+    def __init__(self, config: dict):
+        self.server_address = config.get("OLLAMA_SERVER_ADDRESS")
+        if not self.server_address:
+            raise ValueError("OLLAMA_SERVER_ADDRESS not found in .env file")
+
+        self.settings = _client_settings(config)
+        self._session = None
+        self.cache = ResponseCache.from_config(config)
+        # Timings and token counts of the most recently finished call, see new_metrics
+        self.last_metrics = new_metrics(None)
+        self.metrics_log = MetricsLog.from_config(config)
+
+    def _get_session(self):
+        # aiohttp is imported here so that synchronous plugins don't pay for it
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.settings['max_connections'])
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=self.settings['connect_timeout'],
+                sock_read=self.settings['read_timeout'],
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def _post(self, payload: dict):
+        """
+        POSTs a generate request, retrying refused connections and 429/5xx
+        responses with backoff. Returns the open response, which the caller must release.
+        """
+        import aiohttp
+
+        session = self._get_session()
+        url = f"{self.server_address}/api/generate"
+        attempts = self.settings['max_retries'] + 1
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = await session.post(url, json=payload)
+            except asyncio.TimeoutError:
+                # A timeout means the model is busy; retrying would only queue the same work again
+                raise
+            except aiohttp.ClientConnectionError:
+                if last_attempt:
+                    raise
+                await self._backoff(attempt)
+                continue
+
+            if response.status in RETRY_STATUS_CODES and not last_attempt:
+                response.release()
+                await self._backoff(attempt)
+                continue
+            response.raise_for_status()
+            return response
+
+    async def generate(self, model: str, prompt: str, system: str = None, use_cache: bool = True):
+        """
+        Sends a prompt to the Ollama server and gets a response without blocking the event loop.
+        """
+        import aiohttp
+
+        start = time.perf_counter()
+        metrics = new_metrics(model)
+        cache_key = self.cache.make_key(model, prompt, system) if self.cache and use_cache else None
+        try:
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    metrics['cached'] = True
+                    return cached
+
+            http_start = time.perf_counter()
+            response = await self._post(_build_payload(model, prompt, system))
+            async with response:
+                text = await response.text()
+            metrics['http_time'] = time.perf_counter() - http_start
+            result, final = _parse_response(text)
+            add_server_metrics(metrics, final)
+            if cache_key and not _is_error(result):
+                self.cache.put(cache_key, result)
+            return result
+        except asyncio.TimeoutError as e:
+            return _failed(metrics, f"Error connecting to Ollama: timed out ({e})")
+        except aiohttp.ClientError as e:
+            return _failed(metrics, f"Error connecting to Ollama: {e}")
         except json.JSONDecodeError:
-            return "Error: Could not decode the response from Ollama."
+            return _failed(metrics, "Error: Could not decode the response from Ollama.")
+        finally:
+            self._record(metrics, start)
+
+    async def generate_stream(self, model: str, prompt: str, system: str = None, use_cache: bool = True):
+        """
+        Async iterator over the response text as the model produces it, for use
+        with 'async for'. On failure, an error message is yielded instead.
+        """
+        import aiohttp
+
+        start = time.perf_counter()
+        metrics = new_metrics(model)
+        cache_key = self.cache.make_key(model, prompt, system) if self.cache and use_cache else None
+        tokens = []
+        try:
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    metrics['cached'] = True
+                    metrics['time_to_first_token'] = time.perf_counter() - start
+                    yield cached
+                    return
+
+            http_start = time.perf_counter()
+            response = await self._post(_build_payload(model, prompt, system, stream=True))
+            async with response:
+                async for line in response.content:
+                    chunk = _parse_stream_line(line)
+                    if 'error' in chunk:
+                        yield _failed(metrics, f"Error from Ollama: {chunk['error']}")
+                        return
+                    token = chunk.get('response')
+                    if token:
+                        if metrics['time_to_first_token'] is None:
+                            metrics['time_to_first_token'] = time.perf_counter() - start
+                        tokens.append(token)
+                        yield token
+                    if chunk.get('done'):
+                        metrics['http_time'] = time.perf_counter() - http_start
+                        add_server_metrics(metrics, chunk)
+                        if cache_key:
+                            self.cache.put(cache_key, "".join(tokens))
+                        return
+
+        except asyncio.TimeoutError as e:
+            yield _failed(metrics, f"Error connecting to Ollama: timed out ({e})")
+        except aiohttp.ClientError as e:
+            yield _failed(metrics, f"Error connecting to Ollama: {e}")
+        except json.JSONDecodeError:
+            yield _failed(metrics, "Error: Could not decode the response from Ollama.")
+        finally:
+            self._record(metrics, start)
+
+    def _record(self, metrics: dict, start: float):
+        metrics['wall_time'] = time.perf_counter() - start
+        self.last_metrics = metrics
+        if self.metrics_log:
+            self.metrics_log.write(metrics)
+
+    async def _backoff(self, attempt: int):
+        await asyncio.sleep(self.settings['backoff_factor'] * (2 ** attempt))
+
+    async def close(self):
+        """Closes the pooled connections and the response cache."""
+        if self._session is not None:
+            await self._session.close()
+        if self.cache:
+            self.cache.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+class SharedClients:
+    """
+    Ollama clients kept open across task runs by long-running modes such as
+    'serve', so connections stay warm between runs. They are put into the
+    config as 'shared_clients', and plugins get them through open_client and
+    open_async_client. Each client is created on first use.
+    """
+    def __init__(self, config: dict):
+        self.config = config
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def client(self) -> OllamaClient:
+        # Synchronous plugins run in worker threads, which may ask at the same time
+        with self._lock:
+            if self._client is None:
+                self._client = OllamaClient(self.config)
+            return self._client
+
+    def async_client(self) -> AsyncOllamaClient:
+        if self._async_client is None:
+            self._async_client = AsyncOllamaClient(self.config)
+        return self._async_client
+
+    async def close(self):
+        if self._client is not None:
+            self._client.close()
+        if self._async_client is not None:
+            await self._async_client.close()
+
+@contextmanager
+def open_client(config: dict):
+    """
+    Gives an OllamaClient for the duration of a 'with' block: the shared client
+    if the config has one, otherwise a new client that is closed afterwards.
+    """
+    shared = config.get('shared_clients')
+    if shared is not None:
+        yield shared.client()
+        return
+    with OllamaClient(config) as client:
+        yield client
+
+@asynccontextmanager
+async def open_async_client(config: dict):
+    """Like open_client, for an AsyncOllamaClient in an 'async with' block."""
+    shared = config.get('shared_clients')
+    if shared is not None:
+        yield shared.async_client()
+        return
+    async with AsyncOllamaClient(config) as client:
+        yield client
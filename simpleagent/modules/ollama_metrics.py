@@ -0,0 +1,100 @@
+# modules/ollama_metrics.py
+import contextvars
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+
+# Timings and token counts reported in Ollama's final response; durations are in nanoseconds
+SERVER_DURATIONS = ('total_duration', 'load_duration', 'prompt_eval_duration', 'eval_duration')
+SERVER_COUNTS = ('prompt_eval_count', 'eval_count')
+
+# The task being run, set by main.py; tasks running concurrently each see their own
+current_task = contextvars.ContextVar('current_task', default=None)
+
+# A model load longer than this means the model was not in memory yet
+COLD_LOAD_SECONDS = 1.0
+
+def new_metrics(model: str) -> dict:
+    """
+    Returns the metrics of a call that has just started. All times are in
+    seconds, and values that were not measured stay None:
+    - wall_time: the whole call, as seen by the caller
+    - http_time: sending the request until the complete response was received
+    - time_to_first_token: until the first piece of a streamed response arrived
+    - total_duration, load_duration, prompt_eval_duration, eval_duration,
+      prompt_eval_count, eval_count: as reported by Ollama
+    - prompt_tokens_per_second, eval_tokens_per_second: derived from the above
+    """
+    metrics = {
+        "model": model,
+        "cached": False,
+        "error": None,
+        "wall_time": None,
+        "http_time": None,
+        "time_to_first_token": None,
+    }
+    metrics.update(dict.fromkeys(SERVER_DURATIONS + SERVER_COUNTS))
+    metrics.update(prompt_tokens_per_second=None, eval_tokens_per_second=None)
+    return metrics
+
+def add_server_metrics(metrics: dict, response: dict):
+    """Copies the timings and token counts from Ollama's final response, with durations in seconds."""
+    for key in SERVER_DURATIONS:
+        if response.get(key) is not None:
+            metrics[key] = response[key] / 1e9
+    for key in SERVER_COUNTS:
+        if response.get(key) is not None:
+            metrics[key] = response[key]
+
+    if metrics['prompt_eval_count'] and metrics['prompt_eval_duration']:
+        metrics['prompt_tokens_per_second'] = metrics['prompt_eval_count'] / metrics['prompt_eval_duration']
+    if metrics['eval_count'] and metrics['eval_duration']:
+        metrics['eval_tokens_per_second'] = metrics['eval_count'] / metrics['eval_duration']
+
+def format_metrics(metrics: dict) -> str:
+    """Describes the metrics of a call in one line, e.g. for printing after a response."""
+    if metrics['cached']:
+        return f"answered from cache in {metrics['wall_time']:.1f}s"
+
+    parts = []
+    if metrics['load_duration'] is not None and metrics['load_duration'] >= COLD_LOAD_SECONDS:
+        parts.append(f"model loaded in {metrics['load_duration']:.1f}s")
+    if metrics['prompt_tokens_per_second']:
+        parts.append(f"{metrics['prompt_eval_count']} prompt tokens at {metrics['prompt_tokens_per_second']:.0f} tokens/s")
+    if metrics['eval_tokens_per_second']:
+        parts.append(f"{metrics['eval_count']} tokens generated at {metrics['eval_tokens_per_second']:.1f} tokens/s")
+    if metrics['time_to_first_token'] is not None:
+        parts.append(f"first token after {metrics['time_to_first_token']:.1f}s")
+    if metrics['wall_time'] is not None:
+        parts.append(f"complete after {metrics['wall_time']:.1f}s")
+    return ", ".join(parts)
+
+class MetricsLog:
+    """
+    Appends the metrics of every Ollama call to a JSONL file, one JSON object
+    per line with the time and task added, so cold loads, token rates and
+    prompt sizes can be compared across runs and plugins.
+    """
+    def __init__(self, path):
+        self.path = Path(path).expanduser()
+        # Clients may be used from worker threads, so writes are serialized
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Returns a log if 'ollama: metrics_file' is set in the config, otherwise None."""
+        metrics_file = (config.get('ollama') or {}).get('metrics_file')
+        if not metrics_file:
+            return None
+        return cls(metrics_file)
+
+    def write(self, metrics: dict):
+        record = {"timestamp": datetime.now().astimezone().isoformat(timespec='seconds'), "task": current_task.get()}
+        record.update(metrics)
+        line = json.dumps(record) + "\n"
+        try:
+            with self._lock, open(self.path, 'a') as f:
+                f.write(line)
+        except OSError as e:
+            print(f"Warning: Could not write Ollama metrics to {self.path}: {e}")
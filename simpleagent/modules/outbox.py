@@ -0,0 +1,93 @@
+# modules/outbox.py
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_OUTBOX_FILE = Path.home() / ".simpleagent_outbox.sqlite"
+# A claimed notification is offered again after this long, in case the process delivering it died
+CLAIM_SECONDS = 300
+CLAIM_BATCH_SIZE = 50
+
+class Outbox:
+    """
+    On-disk spool of notifications waiting to be delivered, one row per channel
+    and destination. Rows are claimed before they are delivered, so several
+    simpleagent processes sharing the file never send the same one twice, and
+    a row that was claimed by a process that died is picked up again later.
+    """
+    def __init__(self, path=None):
+        self.path = Path(path or DEFAULT_OUTBOX_FILE).expanduser()
+        # The dispatcher's threads share the connection, so access is serialized
+        self._lock = threading.Lock()
+        # Autocommit, with an explicit transaction where rows are claimed
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                message TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                created REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS notifications_due ON notifications (channel, next_attempt)")
+
+    def add(self, channel: str, destinations: list, message: str):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO notifications (channel, destination, message, next_attempt, created) VALUES (?, ?, ?, ?, ?)",
+                [(channel, destination, message, now, now) for destination in destinations])
+
+    def claim_due(self, channel: str) -> list:
+        """Claims the notifications of a channel that are due, as (id, destination, message, attempts) rows."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, destination, message, attempts FROM notifications"
+                    " WHERE channel = ? AND next_attempt <= ? ORDER BY id LIMIT ?",
+                    (channel, now, CLAIM_BATCH_SIZE)).fetchall()
+                self._conn.executemany("UPDATE notifications SET next_attempt = ? WHERE id = ?",
+                                       [(now + CLAIM_SECONDS, row[0]) for row in rows])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def remove(self, notification_id: int):
+        """Removes a notification once it was delivered, or given up on."""
+        with self._lock:
+            self._conn.execute("DELETE FROM notifications WHERE id = ?", (notification_id,))
+
+    def retry_later(self, notification_id: int, attempts: int, delay: float, error: str):
+        with self._lock:
+            self._conn.execute("UPDATE notifications SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                               (attempts, time.time() + delay, error, notification_id))
+
+    def seconds_until_due(self, channel: str):
+        """Returns how long until the next notification of a channel is due, or None if there is none."""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_attempt) FROM notifications WHERE channel = ?", (channel,)).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def count(self, due_only: bool = False) -> int:
+        """Returns the number of notifications waiting, or only of those that are due now."""
+        with self._lock:
+            if due_only:
+                row = self._conn.execute("SELECT COUNT(*) FROM notifications WHERE next_attempt <= ?", (time.time(),)).fetchone()
+            else:
+                row = self._conn.execute("SELECT COUNT(*) FROM notifications").fetchone()
+        return row[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
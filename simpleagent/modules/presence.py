@@ -0,0 +1,73 @@
+# modules/presence.py
+
+# Defaults for the 'bluetooth_tracker' regularity settings
+DEFAULT_WINDOW_DAYS = 7
+DEFAULT_BUCKET_MINUTES = 15
+# With time-of-day profiles, buckets this close to the same time on other days count too
+PROFILE_SPREAD_BUCKETS = 2
+# Fewer observed buckets than this at the time of day fall back to the whole window
+MIN_PROFILE_BUCKETS = 3
+
+class PresenceModel:
+    """
+    Sliding-window presence of devices, kept as bitmaps of fixed-size time
+    buckets: bit 0 is the bucket of the last update, bit 1 the one before it,
+    and so on, up to the size of the window. Marking a sighting shifts the
+    bitmap and sets bit 0, which is O(1). The tracker keeps a bitmap of the
+    buckets in which it was scanning as well, and a device's regularity is
+    the share of those buckets in which it was seen. With time-of-day
+    profiles, only buckets around the current time of day on each day of the
+    window are counted, so e.g. a device that is only there during working
+    hours is regular then, and unexpected at night.
+    """
+    def __init__(self, window_days: float = DEFAULT_WINDOW_DAYS, bucket_minutes: float = DEFAULT_BUCKET_MINUTES,
+                 time_of_day_profiles: bool = False):
+        self.bucket_seconds = bucket_minutes * 60
+        self.size = max(1, int(window_days * 24 * 60 // bucket_minutes))
+        self.full_mask = (1 << self.size) - 1
+        self.profile_mask = None
+        if time_of_day_profiles:
+            per_day = int(24 * 60 // bucket_minutes)
+            self.profile_mask = 0
+            for day_start in range(0, self.size, per_day):
+                for offset in range(-PROFILE_SPREAD_BUCKETS, PROFILE_SPREAD_BUCKETS + 1):
+                    if 0 <= day_start + offset < self.size:
+                        self.profile_mask |= 1 << (day_start + offset)
+
+    @classmethod
+    def from_config(cls, task_config: dict):
+        return cls(float(task_config.get('regularity_window_days', DEFAULT_WINDOW_DAYS)),
+                   float(task_config.get('presence_bucket_minutes', DEFAULT_BUCKET_MINUTES)),
+                   bool(task_config.get('time_of_day_profiles', False)))
+
+    def bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    def align(self, bitmap: int, bitmap_bucket: int, now_bucket: int) -> int:
+        """Returns a bitmap last updated in bitmap_bucket as of now_bucket."""
+        if bitmap_bucket is None:
+            return 0
+        shift = now_bucket - bitmap_bucket
+        if shift >= self.size:
+            return 0
+        return (bitmap << max(0, shift)) & self.full_mask
+
+    def mark(self, bitmap: int, bitmap_bucket: int, now_bucket: int) -> tuple:
+        """Returns the bitmap, with the current bucket set, and its new bucket."""
+        return self.align(bitmap, bitmap_bucket, now_bucket) | 1, now_bucket
+
+    def full(self, now_bucket: int) -> tuple:
+        """Returns a bitmap with every bucket of the window set, to seed history that predates it."""
+        return self.full_mask, now_bucket
+
+    def regularity(self, presence: int, presence_bucket: int, observed: int, observed_bucket: int, now_bucket: int) -> float:
+        """Returns the share of observed buckets in the window in which the device was present."""
+        presence = self.align(presence, presence_bucket, now_bucket)
+        observed = self.align(observed, observed_bucket, now_bucket)
+        if self.profile_mask is not None and (observed & self.profile_mask).bit_count() >= MIN_PROFILE_BUCKETS:
+            presence &= self.profile_mask
+            observed &= self.profile_mask
+        observed_count = observed.bit_count()
+        if observed_count == 0:
+            return 0.0
+        return (presence & observed).bit_count() / observed_count
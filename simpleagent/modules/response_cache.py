@@ -0,0 +1,117 @@
+# modules/response_cache.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Defaults for the optional 'ollama: cache:' section of config.yaml
+DEFAULT_CACHE_FILE = Path.home() / ".simpleagent_response_cache.sqlite"
+DEFAULT_TTL_HOURS = 24
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_SIZE_MB = 50
+DEFAULT_TIME_BUCKET_MINUTES = 60
+
+class ResponseCache:
+    """
+    On-disk cache of model responses, keyed on the model, prompt and system prompt.
+
+    The current time that OllamaClient adds to every system prompt would make
+    every key unique, so it is replaced in the key by a time bucket: identical
+    requests within the same 'time_bucket_minutes' window share an entry. With a
+    bucket of 0 the time is left out of the key entirely. Entries expire after
+    'ttl_hours', and the least recently used entries are evicted once the cache
+    holds more than 'max_entries' entries or 'max_size_mb' of responses.
+    """
+    def __init__(self, cache_config: dict):
+        self.path = Path(cache_config.get('path') or DEFAULT_CACHE_FILE).expanduser()
+        self.ttl = float(cache_config.get('ttl_hours', DEFAULT_TTL_HOURS)) * 3600
+        self.max_entries = int(cache_config.get('max_entries', DEFAULT_MAX_ENTRIES))
+        self.max_bytes = int(float(cache_config.get('max_size_mb', DEFAULT_MAX_SIZE_MB)) * 1024 * 1024)
+        self.time_bucket = float(cache_config.get('time_bucket_minutes', DEFAULT_TIME_BUCKET_MINUTES)) * 60
+
+        # Clients may be used from worker threads, so access is serialized
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Returns a cache if 'ollama: cache: enabled' is set in the config, otherwise None."""
+        cache_config = (config.get('ollama') or {}).get('cache') or {}
+        if not cache_config.get('enabled', False):
+            return None
+        try:
+            return cls(cache_config)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open response cache, continuing without it: {e}")
+            return None
+
+    def make_key(self, model: str, prompt: str, system: str = None) -> str:
+        """Builds the cache key, with the current time reduced to its bucket."""
+        time_bucket = int(time.time() // self.time_bucket) if self.time_bucket > 0 else None
+        key_data = json.dumps([model, prompt, system, time_bucket])
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Returns the cached response, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created = row
+            if now - created > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return response
+
+    def put(self, key: str, response: str):
+        """Stores a response, then evicts expired and least recently used entries."""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        count, total_size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+
+        # Walk from the least recently used entry until both limits are met
+        to_delete = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if count <= self.max_entries and total_size <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            count -= 1
+            total_size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
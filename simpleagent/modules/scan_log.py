@@ -0,0 +1,195 @@
+# modules/scan_log.py
+import gzip
+import json
+import os
+import time
+from pathlib import Path
+
+# Defaults for the scan log settings of the 'bluetooth_tracker' task
+DEFAULT_SEGMENT_MAX_MB = 5
+DEFAULT_SEGMENT_HOURS = 24
+DEFAULT_RETENTION_DAYS = 90
+
+ACTIVE_SEGMENT = "current.jsonl"
+INDEX_FILE = "index.json"
+SEGMENT_PATTERN = "scans-*.jsonl.gz"
+
+def _segment_range(path: Path) -> tuple:
+    """Returns the first and last scan time of a closed segment, from its name 'scans-<first>-<last>.jsonl.gz'."""
+    first, last = path.name[len("scans-"):-len(".jsonl.gz")].split("-")
+    return int(first), int(last)
+
+def _within(timestamp: float, since: float = None, until: float = None) -> bool:
+    return (since is None or timestamp >= since) and (until is None or timestamp <= until)
+
+class ScanLog:
+    """
+    Structured log of every scan, kept in a directory of segments. Each scan
+    is one JSON line: {"t": unix time, "devices": [[fingerprint, address, rssi], ...]}.
+    The active segment is plain text. Once it is larger than 'segment_max_mb'
+    or spans more than 'segment_hours', it is compressed with gzip under a
+    name holding its time range, and its number of scans, fingerprints and
+    addresses are added to an index. Queries only open the segments whose
+    time range and index entry can match. Segments older than
+    'retention_days' are deleted.
+    """
+    def __init__(self, directory, segment_max_mb: float = DEFAULT_SEGMENT_MAX_MB,
+                 segment_hours: float = DEFAULT_SEGMENT_HOURS, retention_days: float = DEFAULT_RETENTION_DAYS):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.active_path = self.directory / ACTIVE_SEGMENT
+        self.index_path = self.directory / INDEX_FILE
+        self.segment_max_bytes = int(float(segment_max_mb) * 1024 * 1024)
+        self.segment_seconds = float(segment_hours) * 3600
+        self.retention_seconds = float(retention_days) * 86400
+        self._active_start = None
+        self.index = self._load_index()
+
+    @classmethod
+    def from_config(cls, task_config: dict):
+        """
+        Returns the scan log of the bluetooth_tracker task, in 'scan_log_dir'.
+        Older configs only have 'scan_log_file', whose name without the
+        extension is used as the directory instead. Returns None if neither is set.
+        """
+        directory = task_config.get('scan_log_dir')
+        if not directory:
+            scan_log_file = task_config.get('scan_log_file')
+            if not scan_log_file:
+                return None
+            directory = Path(scan_log_file).with_suffix('')
+        return cls(directory,
+                   task_config.get('scan_log_segment_max_mb', DEFAULT_SEGMENT_MAX_MB),
+                   task_config.get('scan_log_segment_hours', DEFAULT_SEGMENT_HOURS),
+                   task_config.get('scan_log_retention_days', DEFAULT_RETENTION_DAYS))
+
+    def _load_index(self) -> dict:
+        """Reads the index, adding any closed segment that is missing from it, e.g. after a crash."""
+        index = {}
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                index = {}
+        segments = {path.name for path in self.directory.glob(SEGMENT_PATTERN)}
+        missing = segments - set(index)
+        for name in missing:
+            index[name] = self._index_entry(self._read_segment(self.directory / name))
+        stale = set(index) - segments
+        for name in stale:
+            del index[name]
+        if missing or stale:
+            self._write_index(index)
+        return index
+
+    def _write_index(self, index: dict):
+        temporary = self.index_path.with_suffix('.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(index, f)
+        os.replace(temporary, self.index_path)
+
+    @staticmethod
+    def _index_entry(scans) -> dict:
+        fingerprints, addresses = set(), set()
+        count = 0
+        for scan in scans:
+            count += 1
+            for fingerprint, address, _ in scan['devices']:
+                fingerprints.add(fingerprint)
+                addresses.add(address)
+        return {"scans": count, "fingerprints": sorted(fingerprints), "addresses": sorted(addresses)}
+
+    @staticmethod
+    def _read_segment(path: Path):
+        opener = gzip.open if path.suffix == '.gz' else open
+        try:
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A line cut short by a crash
+        except (OSError, EOFError) as e:
+            print(f"Warning: Could not read scan log segment {path}: {e}")
+
+    def _active_start_time(self):
+        if self._active_start is None and self.active_path.exists():
+            for scan in self._read_segment(self.active_path):
+                self._active_start = scan['t']
+                break
+        return self._active_start
+
+    def append(self, timestamp: float, devices: list):
+        """Logs one scan, given as a list of (fingerprint, address, rssi) tuples."""
+        timestamp = int(timestamp)
+        start = self._active_start_time()
+        if start is not None and (timestamp - start >= self.segment_seconds
+                                  or self.active_path.stat().st_size >= self.segment_max_bytes):
+            self.rotate()
+        line = json.dumps({"t": timestamp, "devices": [list(device) for device in devices]}, separators=(',', ':'))
+        with open(self.active_path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+        if self._active_start is None:
+            self._active_start = timestamp
+
+    def rotate(self):
+        """Compresses the active segment, adds it to the index and deletes segments past the retention."""
+        scans = list(self._read_segment(self.active_path)) if self.active_path.exists() else []
+        if scans:
+            name = f"scans-{scans[0]['t']}-{scans[-1]['t']}.jsonl.gz"
+            with open(self.active_path, 'rb') as source, gzip.open(self.directory / name, 'wb') as target:
+                target.write(source.read())
+            self.index[name] = self._index_entry(scans)
+        if self.active_path.exists():
+            self.active_path.unlink()
+        self._active_start = None
+
+        cutoff = time.time() - self.retention_seconds
+        for path in self.directory.glob(SEGMENT_PATTERN):
+            if _segment_range(path)[1] < cutoff:
+                path.unlink()
+                self.index.pop(path.name, None)
+        self._write_index(self.index)
+
+    def scans(self, since: float = None, until: float = None, fingerprint: str = None, address: str = None):
+        """
+        Yields the logged scans, oldest first, within the time range and, if
+        given, only from segments that contain the fingerprint or address.
+        """
+        segments = []
+        for name, entry in self.index.items():
+            first, last = _segment_range(self.directory / name)
+            if since is not None and last < since or until is not None and first > until:
+                continue
+            if fingerprint is not None and fingerprint not in entry['fingerprints']:
+                continue
+            if address is not None and address not in entry['addresses']:
+                continue
+            segments.append((first, self.directory / name))
+        paths = [path for _, path in sorted(segments)]
+        if self.active_path.exists():
+            paths.append(self.active_path)
+
+        for path in paths:
+            for scan in self._read_segment(path):
+                if _within(scan['t'], since, until):
+                    yield scan
+
+    def count_scans(self, since: float = None, until: float = None) -> int:
+        """
+        Returns the number of scans within the time range. Segments that lie
+        entirely within it are counted from the index, without opening them.
+        """
+        count = 0
+        for name, entry in self.index.items():
+            first, last = _segment_range(self.directory / name)
+            if since is not None and last < since or until is not None and first > until:
+                continue
+            if _within(first, since, until) and _within(last, since, until):
+                count += entry['scans']
+            else:
+                count += sum(1 for scan in self._read_segment(self.directory / name) if _within(scan['t'], since, until))
+        if self.active_path.exists():
+            count += sum(1 for scan in self._read_segment(self.active_path) if _within(scan['t'], since, until))
+        return count
@@ -0,0 +1,234 @@
+# modules/scheduler.py
+import asyncio
+import signal
+from datetime import datetime, timedelta
+from modules.ollama_client import SharedClients
+from modules.task_runner import run_task
+
+# How often the config files are checked for changes, in seconds
+RELOAD_CHECK_SECONDS = 5
+
+# (name, lowest value, highest value) of the five cron fields
+CRON_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day of month', 1, 31), ('month', 1, 12), ('day of week', 0, 7))
+
+def _parse_cron_field(field: str, name: str, low: int, high: int) -> set:
+    """Parses one cron field such as '*', '5', '1-5', '*/15' or '0,30' into its set of values."""
+    values = set()
+    for part in field.split(','):
+        value_range, _, step = part.partition('/')
+        try:
+            step = int(step) if step else 1
+            if value_range == '*':
+                start, end = low, high
+            elif '-' in value_range:
+                start, end = (int(v) for v in value_range.split('-', 1))
+            else:
+                start = int(value_range)
+                end = high if step > 1 else start
+        except ValueError:
+            raise ValueError(f"invalid {name} field '{field}'")
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"{name} field '{field}' is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSchedule:
+    """A standard five-field cron expression, e.g. '0 8 * * 1-5' for 08:00 on weekdays, in local time."""
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression '{expression}' must have 5 fields")
+        self.expression = expression
+        parsed = [_parse_cron_field(field, *spec) for field, spec in zip(fields, CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # Both 0 and 7 mean Sunday
+        self.weekdays = {day % 7 for day in weekdays}
+        # As in cron, if both day fields are restricted, a day matching either one counts
+        self.any_day = fields[2] == '*' or fields[4] == '*'
+        self.next_after(datetime.now())  # Fails now for dates that never happen, e.g. Feb 30
+
+    def _day_matches(self, t: datetime) -> bool:
+        day_matches = t.day in self.days
+        weekday_matches = (t.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return day_matches and weekday_matches
+        return day_matches or weekday_matches
+
+    def next_after(self, after: datetime) -> datetime:
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron expression '{self.expression}' never matches")
+
+    def first_run(self, now: datetime) -> datetime:
+        return self.next_after(now)
+
+class IntervalSchedule:
+    """Runs a task when the service starts, then every 'minutes' minutes."""
+    def __init__(self, minutes: float):
+        if minutes <= 0:
+            raise ValueError("interval_minutes must be greater than 0")
+        self.interval = timedelta(minutes=minutes)
+
+    def next_after(self, after: datetime) -> datetime:
+        return after + self.interval
+
+    def first_run(self, now: datetime) -> datetime:
+        return now
+
+def parse_schedule(schedule_config: dict):
+    """Builds the schedule of a task from its 'schedule' section: 'cron' or 'interval_minutes'."""
+    if not isinstance(schedule_config, dict):
+        raise ValueError("schedule must contain 'cron' or 'interval_minutes'")
+    if 'cron' in schedule_config:
+        return CronSchedule(str(schedule_config['cron']))
+    if 'interval_minutes' in schedule_config:
+        return IntervalSchedule(float(schedule_config['interval_minutes']))
+    raise ValueError("schedule must contain 'cron' or 'interval_minutes'")
+
+class Scheduler:
+    """
+    Runs tasks on the schedules in config.yaml from one long-lived process, so
+    the start-up, imports and Ollama connections are paid for once rather than
+    on every run. A run is skipped if the previous run of the same task is
+    still going, and the config is reloaded when config.yaml or .env change.
+    """
+    def __init__(self, plugins: dict, load_plugin, load_config, config_files):
+        self.plugins = plugins
+        self.load_plugin = load_plugin
+        self.load_config = load_config
+        self.config_files = config_files
+        self.config = None
+        self.clients = None
+        self.schedules = {}   # task name -> (schedule config, schedule)
+        self.next_runs = {}   # task name -> datetime
+        self.running = {}     # task name -> asyncio.Task
+        self._closing = set()  # tasks closing old clients, kept so they aren't garbage-collected
+        self._mtimes = None
+
+    def _file_mtimes(self):
+        mtimes = []
+        for path in self.config_files:
+            try:
+                mtimes.append(path.stat().st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def _apply_config(self, config: dict):
+        """Reads the schedules from a newly loaded config, keeping the next run of unchanged ones."""
+        now = datetime.now()
+        schedules = {}
+        for name, task_config in (config.get('tasks') or {}).items():
+            schedule_config = (task_config or {}).get('schedule')
+            if schedule_config is None:
+                continue
+            if name not in self.plugins:
+                print(f"Warning: Ignoring schedule of unknown task '{name}'.")
+                continue
+            try:
+                schedule = parse_schedule(schedule_config)
+            except ValueError as e:
+                print(f"Warning: Ignoring schedule of task '{name}': {e}")
+                continue
+            schedules[name] = (schedule_config, schedule)
+
+        next_runs = {}
+        for name, (schedule_config, schedule) in schedules.items():
+            previous = self.schedules.get(name)
+            if previous and previous[0] == schedule_config:
+                next_runs[name] = self.next_runs[name]
+            else:
+                next_runs[name] = schedule.first_run(now)
+                print(f"Scheduled '{name}', next run at {next_runs[name]:%Y-%m-%d %H:%M}.")
+
+        # Tasks that are still running keep the clients they started with
+        old_clients = self.clients
+        config['shared_clients'] = self.clients = SharedClients(config)
+        if old_clients is not None:
+            closing = asyncio.create_task(self._close_when_idle(old_clients, list(self.running.values())))
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+
+        self.config = config
+        self.schedules = schedules
+        self.next_runs = next_runs
+        if not schedules:
+            print("Warning: No task has a 'schedule' in the config, nothing will run.")
+
+    async def _close_when_idle(self, clients: SharedClients, tasks: list):
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await clients.close()
+
+    def _reload_if_changed(self):
+        mtimes = self._file_mtimes()
+        if mtimes == self._mtimes:
+            return
+        self._mtimes = mtimes
+        try:
+            config = self.load_config()
+        except Exception as e:
+            print(f"Error reloading the config, keeping the previous one: {e}")
+            return
+        print("Config changed, reloading.")
+        self._apply_config(config)
+
+    async def _run_task(self, name: str, config: dict):
+        print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Running task '{name}'...")
+        try:
+            await run_task(name, self.load_plugin, config)
+        finally:
+            del self.running[name]
+
+    def _start_due_tasks(self):
+        now = datetime.now()
+        for name, next_run in self.next_runs.items():
+            if next_run > now:
+                continue
+            if name in self.running:
+                print(f"Skipping this run of '{name}', the previous run is still going.")
+            else:
+                self.running[name] = asyncio.create_task(self._run_task(name, self.config))
+            # Runs missed while the machine was asleep are not caught up one by one
+            _, schedule = self.schedules[name]
+            self.next_runs[name] = schedule.next_after(now)
+
+    async def serve(self):
+        self._mtimes = self._file_mtimes()
+        self._apply_config(self.load_config())
+
+        # Stop cleanly on SIGTERM (e.g. from systemd) as well as Ctrl+C
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (NotImplementedError, AttributeError):
+            pass  # Not supported on Windows
+
+        print(f"Serving {len(self.schedules)} scheduled task(s). Press Ctrl+C to stop.")
+        try:
+            while True:
+                self._start_due_tasks()
+                wait = RELOAD_CHECK_SECONDS
+                if self.next_runs:
+                    until_next = (min(self.next_runs.values()) - datetime.now()).total_seconds()
+                    wait = max(0, min(wait, until_next))
+                await asyncio.sleep(wait)
+                self._reload_if_changed()
+        except asyncio.CancelledError:
+            print("Stopping...")
+        finally:
+            tasks = list(self.running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.clients.close()
@@ -0,0 +1,111 @@
+# modules/task_runner.py
+import asyncio
+import contextvars
+import inspect
+import threading
+import time
+from modules.ollama_client import SharedClients
+from modules.ollama_metrics import current_task
+
+def task_timeout(config: dict, name: str, default=None):
+    """
+    Returns the timeout of a task in seconds, from 'timeout_minutes' in its
+    config section, or the default. None means the task may run forever.
+    """
+    task_config = (config.get('tasks') or {}).get(name) or {}
+    minutes = task_config.get('timeout_minutes')
+    if minutes is None:
+        return default
+    seconds = float(minutes) * 60
+    if seconds <= 0:
+        raise ValueError("timeout_minutes must be greater than 0")
+    return seconds
+
+def _run_in_daemon_thread(func, *args):
+    """
+    Runs func in a daemon thread and returns a future of its result. A thread
+    can't be stopped, so a synchronous task that timed out keeps going, but
+    unlike asyncio.to_thread it doesn't keep the process from exiting.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    context = contextvars.copy_context()
+
+    def settle(result, error):
+        if future.done():
+            return  # Timed out or cancelled in the meantime
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target():
+        result, error = None, None
+        try:
+            result = context.run(func, *args)
+        except BaseException as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:
+            pass  # The event loop has already finished
+
+    threading.Thread(target=target, name=f"task-{current_task.get()}", daemon=True).start()
+    return future
+
+async def run_task(name: str, load_plugin, config: dict, default_timeout=None) -> dict:
+    """
+    Runs the plugin of one task and returns its outcome, so that a failing
+    task never takes others down with it. Async plugins run on the event loop
+    and synchronous ones in a thread. The outcome has the task name, a status
+    ('ok', 'failed' or 'timeout'), the duration in seconds and the error.
+    """
+    current_task.set(name)
+    start = time.perf_counter()
+    status, error = 'ok', None
+    timeout = None
+    try:
+        timeout = task_timeout(config, name, default_timeout)
+        try:
+            plugin_module = load_plugin(name)
+        except ImportError as e:
+            raise RuntimeError(f"Could not load plugin '{name}': {e}") from e
+        if inspect.iscoroutinefunction(plugin_module.run):
+            run = plugin_module.run(config)
+        elif timeout is None:
+            run = asyncio.to_thread(plugin_module.run, config)
+        else:
+            run = _run_in_daemon_thread(plugin_module.run, config)
+        await asyncio.wait_for(run, timeout)
+    except asyncio.TimeoutError:
+        status, error = 'timeout', f"timed out after {timeout / 60:g} minute(s)"
+        print(f"Task '{name}' {error}.")
+    except Exception as e:
+        status, error = 'failed', str(e) or type(e).__name__
+        print(f"An error occurred while running task '{name}': {error}")
+    seconds = time.perf_counter() - start
+    if status == 'ok':
+        print(f"Task '{name}' finished in {seconds:.1f}s.")
+    return {"task": name, "status": status, "seconds": seconds, "error": error}
+
+async def run_tasks(names: list, load_plugin, config: dict, default_timeout=None) -> list:
+    """
+    Runs several tasks concurrently in one event loop, sharing the config and
+    the Ollama clients, and returns their outcomes in the order given.
+    """
+    config['shared_clients'] = clients = SharedClients(config)
+    try:
+        return await asyncio.gather(*(run_task(name, load_plugin, config, default_timeout) for name in names))
+    finally:
+        await clients.close()
+
+def format_report(outcomes: list) -> str:
+    """Describes the outcome and duration of each task as a small table."""
+    width = max(len(outcome['task']) for outcome in outcomes)
+    lines = ["--- Task Report ---"]
+    for outcome in outcomes:
+        line = f"{outcome['task']:<{width}}  {outcome['status']:<7}  {outcome['seconds']:>7.1f}s"
+        if outcome['error']:
+            line += f"  {outcome['error']}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -1,9 +1,26 @@
 import asyncio
-import json
 from bleak import BleakScanner
 from datetime import datetime, timedelta, timezone
 import os
+import sqlite3
 from modules.notifier import Notifier
+from modules.device_store import DeviceRecord, DeviceStore, fingerprint_id, open_knowledge_base
+from modules.presence import PresenceModel
+from modules.scan_log import ScanLog
+
+# Defaults for alerts in monitoring mode
+DEFAULT_ALERT_COOLDOWN_MINUTES = 60  # A device is alerted at most once per cooldown
+MAX_DIGEST_DEVICES = 20              # Devices listed in one digest, the rest are counted
+
+# Defaults for continuous mode
+DEFAULT_SCAN_WINDOW_SECONDS = 60      # Advertisements within one window count as one scan
+DEFAULT_FLUSH_INTERVAL_SECONDS = 300  # How often the knowledge base is saved
+DIGEST_DELAY_SECONDS = 5              # Alerts arriving this close together share a notification
+
+# Defaults for forgetting rotated MAC addresses and devices that stopped showing up
+DEFAULT_MAX_ADDRESSES_PER_DEVICE = 20
+DEFAULT_ADDRESS_MAX_AGE_DAYS = 7
+DEFAULT_DEVICE_MAX_AGE_DAYS = 30      # Only devices that are not regular are forgotten
 
 def create_fingerprint(device_data: dict) -> str:
     """
@@ -16,70 +33,222 @@ def create_fingerprint(device_data: dict) -> str:
     # Service UUIDs also help define the device's capabilities
     uuids = sorted(device_data.get("service_uuids", []))
 
-    # The combination of these, sorted to ensure consistency, forms the fingerprint.
-    fingerprint_tuple = (tuple(mfr_ids), tuple(uuids))
+    # The combination of these, sorted to ensure consistency, forms the fingerprint,
+    # which is kept as a short digest.
+    return fingerprint_id(mfr_ids, uuids)
 
-    # We use the string representation of the tuple as a dictionary key.
-    return str(fingerprint_tuple)
+def device_record(d, adv) -> dict:
+    """
+    Turns a device and its advertisement data, as reported by bleak, into a
+    plain dictionary, with its fingerprint worked out once.
+    """
+    name = d.name if d.name else "Unknown Device"
+    device_data = {
+        "name": name,
+        "address": d.address,
+        "rssi": adv.rssi,
+        "manufacturer_data": {comp_id: data.hex() for comp_id, data in adv.manufacturer_data.items()} if adv.manufacturer_data else {},
+        "service_data": {uuid: data.hex() for uuid, data in adv.service_data.items()} if adv.service_data else {},
+        "service_uuids": adv.service_uuids if adv.service_uuids else [],
+    }
+    device_data["fingerprint"] = create_fingerprint(device_data)
+    return device_data
 
 async def scan_devices():
     """Scans for Bluetooth devices and returns a dictionary of them."""
     devices = await BleakScanner.discover(return_adv=True)
-    found_devices = {}
-    for d, adv in devices.values():
-        name = d.name if d.name else "Unknown Device"
-        found_devices[d.address] = {
-            "name": name,
-            "address": d.address,
-            "rssi": adv.rssi,
-            "manufacturer_data": {comp_id: data.hex() for comp_id, data in adv.manufacturer_data.items()} if adv.manufacturer_data else {},
-            "service_data": {uuid: data.hex() for uuid, data in adv.service_data.items()} if adv.service_data else {},
-            "service_uuids": adv.service_uuids if adv.service_uuids else [],
-        }
-    return found_devices
+    return {d.address: device_record(d, adv) for d, adv in devices.values()}
 
-def load_knowledge_base(kb_file):
-    """Loads the device knowledge base from a JSON file."""
-    if not os.path.exists(kb_file):
-        return None
+def save_knowledge_base(store: DeviceStore, kb: dict, fingerprints=None):
+    """Saves the given devices, or all of them, and the state of the knowledge base."""
     try:
-        with open(kb_file, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
-        return None # Return None to indicate a problem or empty file
+        store.save(kb, fingerprints)
+    except sqlite3.Error as e:
+        print(f"Error saving knowledge base: {e}")
 
-def save_knowledge_base(kb_file, data):
-    """Saves the device knowledge base to a JSON file."""
-    try:
-        with open(kb_file, 'w') as f:
-            json.dump(data, f, indent=2)
-    except IOError as e:
-        print(f"Error saving knowledge base file: {e}")
-
-def log_scan_results(log_file, devices):
-    """Logs all found devices to a file in a human-readable format."""
-    timestamp = datetime.now().astimezone().isoformat()
+def log_scan_results(scan_log: ScanLog, devices):
+    """Logs the fingerprint, address and RSSI of every found device to the structured scan log."""
     try:
-        with open(log_file, 'a') as f:
-            f.write(f"--- Scan at {timestamp} ---\n")
-            if not devices:
-                f.write("No devices found.\n\n")
-                return
-
-            f.write(f"{'Name':<30} | {'Address':<20} | {'RSSI':>5} | {'Fingerprint Components'}\n")
-            f.write("-" * 120 + "\n")
-
-            for device in devices.values():
-                name = device['name']
-                address = device['address']
-                rssi = device['rssi']
-                mfr_ids = sorted(list(device.get("manufacturer_data", {}).keys()))
-                uuids = sorted(device.get("service_uuids", []))
-                f.write(f"{name[:30]:<30} | {address:<20} | {rssi:>5} | Mfr IDs: {mfr_ids}, UUIDs: {uuids}\n")
-            f.write("\n")
-    except IOError as e:
+        scan_log.append(datetime.now().timestamp(),
+                        [(device['fingerprint'], device['address'], device['rssi']) for device in devices.values()])
+    except OSError as e:
         print(f"Error writing to scan log: {e}")
 
+def record_device(kb: dict, address: str, device_data: dict, now: datetime, model: PresenceModel,
+                  max_addresses: int = DEFAULT_MAX_ADDRESSES_PER_DEVICE) -> DeviceRecord:
+    """
+    Adds a sighting of a device to the knowledge base, including its presence
+    in the current time bucket, and returns its record there. Beyond
+    max_addresses, the address seen longest ago is forgotten.
+    """
+    fingerprint = device_data['fingerprint']
+    now_iso = now.isoformat()
+
+    kb_device = kb['devices'].get(fingerprint)
+    if kb_device is None:
+        # This is a new fingerprint
+        kb_device = kb['devices'][fingerprint] = DeviceRecord(device_data['name'], first_seen=now_iso)
+
+    # Update name if it was "Unknown" and we found a better one
+    if kb_device.name == "Unknown Device" and device_data['name'] != "Unknown Device":
+        kb_device.name = device_data['name']
+
+    kb_device.last_seen = now_iso
+    kb_device.last_rssi = device_data['rssi']
+    kb_device.presence, kb_device.presence_bucket = model.mark(kb_device.presence, kb_device.presence_bucket,
+                                                               model.bucket(now.timestamp()))
+    addresses = kb_device.addresses
+    addresses[address] = int(now.timestamp()) # Add or update address
+    if len(addresses) > max_addresses:
+        # Devices with random addresses rotate them every few minutes
+        del addresses[min(addresses, key=addresses.get)]
+    return kb_device
+
+def mark_observed(kb: dict, now: datetime, model: PresenceModel):
+    """Records that the tracker was scanning in the current time bucket."""
+    kb['observed'], kb['observed_bucket'] = model.mark(kb.get('observed', 0), kb.get('observed_bucket'),
+                                                       model.bucket(now.timestamp()))
+
+def seed_presence(kb: dict, now: datetime, model: PresenceModel) -> bool:
+    """
+    Gives a knowledge base from before presence bitmaps a starting history:
+    devices found regular by the old learning phase count as present in every
+    bucket of the window, so monitoring carries on without relearning.
+    Returns whether anything was seeded.
+    """
+    if 'observed' in kb or kb['plugin_mode'] != 'monitoring':
+        return False
+    now_bucket = model.bucket(now.timestamp())
+    kb['observed'], kb['observed_bucket'] = model.full(now_bucket)
+    for device in kb['devices'].values():
+        if device.is_regular:
+            device.presence, device.presence_bucket = model.full(now_bucket)
+    return True
+
+def evaluate_regularity(kb: dict, fingerprints, now: datetime, model: PresenceModel, regularity_threshold: float) -> set:
+    """
+    Re-evaluates whether the given devices are regular, from their presence
+    over the window, and returns the fingerprints of those that changed.
+    """
+    changed = set()
+    now_bucket = model.bucket(now.timestamp())
+    observed, observed_bucket = kb.get('observed', 0), kb.get('observed_bucket')
+    for fingerprint in fingerprints:
+        device = kb['devices'].get(fingerprint)
+        if device is None:
+            continue
+        ratio = model.regularity(device.presence, device.presence_bucket, observed, observed_bucket, now_bucket)
+        is_regular = ratio >= regularity_threshold
+        if is_regular != device.is_regular:
+            device.is_regular = is_regular
+            changed.add(fingerprint)
+    return changed
+
+def eviction_settings(task_config: dict) -> tuple:
+    """Returns the address limit per device, and the ages after which addresses and devices are forgotten."""
+    return (
+        int(task_config.get('max_addresses_per_device', DEFAULT_MAX_ADDRESSES_PER_DEVICE)),
+        timedelta(days=task_config.get('address_max_age_days', DEFAULT_ADDRESS_MAX_AGE_DAYS)),
+        timedelta(days=task_config.get('device_max_age_days', DEFAULT_DEVICE_MAX_AGE_DAYS)),
+    )
+
+def prune_knowledge_base(kb: dict, now: datetime, address_max_age: timedelta, device_max_age: timedelta) -> set:
+    """
+    Forgets addresses not seen within address_max_age, and devices that are not
+    regular and were not seen within device_max_age, so the knowledge base
+    stays bounded where many devices pass by. Returns the changed fingerprints.
+    """
+    changed = set()
+    address_cutoff = int((now - address_max_age).timestamp())
+    device_cutoff = now - device_max_age
+    for fingerprint, device in list(kb['devices'].items()):
+        if not device.is_regular and device.last_seen and datetime.fromisoformat(device.last_seen) < device_cutoff:
+            del kb['devices'][fingerprint]
+            changed.add(fingerprint)
+            continue
+        stale = [address for address, last_seen in device.addresses.items() if last_seen < address_cutoff]
+        for address in stale:
+            del device.addresses[address]
+        if stale:
+            changed.add(fingerprint)
+    return changed
+
+def advance_learning(kb: dict, now: datetime, learning_hours: float, regularity_threshold: float, model: PresenceModel):
+    """
+    Counts a scan of the learning phase, and switches to monitoring once the
+    phase is over. Returns the message announcing the switch, or None. The
+    learning phase only holds back alerts until there is some history; from
+    then on regularity is re-evaluated continuously.
+    """
+    kb['total_scans_in_learning_phase'] += 1
+    start_time = datetime.fromisoformat(kb['learning_start_time'])
+    learning_duration = timedelta(hours=learning_hours)
+
+    if now >= start_time + learning_duration:
+        print("Learning phase complete. Calculating baseline of regular devices...")
+        evaluate_regularity(kb, kb['devices'], now, model, regularity_threshold)
+        regular_device_count = sum(device.is_regular for device in kb['devices'].values())
+
+        kb['plugin_mode'] = 'monitoring'
+        msg = f"Bluetooth tracker is now in monitoring mode. Identified {regular_device_count} regular devices."
+        print(msg)
+        return msg
+
+    elapsed = now - start_time
+    print(f"In learning mode. Scan {kb['total_scans_in_learning_phase']}. Time elapsed: {str(elapsed).split('.')[0]}/{learning_duration}")
+    return None
+
+def collect_alerts(found_devices: dict, kb: dict, ignore_list: list, now: datetime, cooldown: timedelta) -> tuple:
+    """
+    Returns the unexpected devices of a scan, one per fingerprint, leaving out
+    those already alerted within the cooldown, along with the number left out.
+    The alert time is kept in the knowledge base, so the cooldown holds across runs.
+    """
+    alerts = []
+    suppressed = 0
+    seen_fingerprints = set()
+    for address, device_data in found_devices.items():
+        if address in ignore_list or device_data['name'] in ignore_list:
+            continue
+
+        fingerprint = device_data['fingerprint']
+        if fingerprint in seen_fingerprints:
+            continue
+        seen_fingerprints.add(fingerprint)
+
+        kb_device = kb['devices'].get(fingerprint)
+        if kb_device is not None and kb_device.is_regular:
+            continue
+
+        last_alerted = kb_device.last_alerted if kb_device is not None else None
+        if last_alerted and now < datetime.fromisoformat(last_alerted) + cooldown:
+            suppressed += 1
+            continue
+
+        alerts.append({
+            "name": kb_device.name if kb_device is not None else device_data.get('name', 'Unknown Device'),
+            "address": address,
+            "rssi": device_data['rssi'],
+        })
+        if kb_device is not None:
+            kb_device.last_alerted = now.isoformat()
+    return alerts, suppressed
+
+def format_digest(alerts: list) -> str:
+    """Combines the alerts of one scan into a single notification."""
+    if len(alerts) == 1:
+        alert = alerts[0]
+        return f"Unexpected device detected: '{alert['name']}' (current address: {alert['address']})."
+
+    # Closest devices first
+    alerts = sorted(alerts, key=lambda alert: alert['rssi'], reverse=True)
+    lines = [f"{len(alerts)} unexpected devices detected:"]
+    for alert in alerts[:MAX_DIGEST_DEVICES]:
+        lines.append(f"- '{alert['name']}' (current address: {alert['address']}, RSSI {alert['rssi']})")
+    if len(alerts) > MAX_DIGEST_DEVICES:
+        lines.append(f"...and {len(alerts) - MAX_DIGEST_DEVICES} more.")
+    return "\n".join(lines)
+
 def initialize_knowledge_base():
     """Creates a new, empty knowledge base structure."""
     print("No existing knowledge base found. Starting in learning mode.")
@@ -90,6 +259,122 @@ def initialize_knowledge_base():
         "devices": {}
     }
 
+class ContinuousTracker:
+    """
+    Listens for advertisements continuously through BleakScanner's detection
+    callback instead of running one scan per process. Presence and RSSI are
+    updated in the knowledge base, held in memory, as advertisements arrive,
+    and unexpected devices are reported within seconds. Advertisements within
+    one 'scan_window_seconds' window count as one scan, so regularity means
+    the same as in scan mode. The knowledge base is saved every
+    'flush_interval_seconds' and when the tracker stops.
+    """
+    def __init__(self, kb: dict, store: DeviceStore, scan_log: ScanLog, task_config: dict, notifier: Notifier):
+        self.kb = kb
+        self.store = store
+        self.scan_log = scan_log
+        self.notifier = notifier
+        self.learning_hours = task_config.get('learning_duration_hours', 4)
+        self.regularity_threshold = task_config.get('regularity_threshold', 0.7)
+        self.ignore_list = task_config.get('ignore_list') or []
+        self.alert_cooldown = timedelta(minutes=task_config.get('alert_cooldown_minutes', DEFAULT_ALERT_COOLDOWN_MINUTES))
+        self.scan_window = float(task_config.get('scan_window_seconds', DEFAULT_SCAN_WINDOW_SECONDS))
+        self.flush_interval = float(task_config.get('flush_interval_seconds', DEFAULT_FLUSH_INTERVAL_SECONDS))
+        self.max_addresses, self.address_max_age, self.device_max_age = eviction_settings(task_config)
+        self.model = PresenceModel.from_config(task_config)
+        self.window_devices = {}   # address -> latest device data in the current window
+        self.window_fingerprints = set()
+        self.changed = set()       # fingerprints changed since the last save
+        self.pending_alerts = []
+        self._digest_timer = None
+        self._loop = None
+
+    def on_advertisement(self, device, advertisement_data):
+        """Detection callback, called by bleak on the event loop for every advertisement."""
+        device_data = device_record(device, advertisement_data)
+        address = device.address
+        now = datetime.now().astimezone()
+        record_device(self.kb, address, device_data, now, self.model, self.max_addresses)
+        fingerprint = device_data['fingerprint']
+        self.window_devices[address] = device_data
+        self.window_fingerprints.add(fingerprint)
+        self.changed.add(fingerprint)
+
+        if self.kb['plugin_mode'] != 'monitoring':
+            return
+        evaluate_regularity(self.kb, [fingerprint], now, self.model, self.regularity_threshold)
+        alerts, _ = collect_alerts({address: device_data}, self.kb, self.ignore_list, now, self.alert_cooldown)
+        if alerts:
+            self.pending_alerts.extend(alerts)
+            if self._digest_timer is None:
+                # Wait briefly, so devices showing up together are reported together
+                self._digest_timer = self._loop.call_later(DIGEST_DELAY_SECONDS, self.send_digest)
+
+    def send_digest(self):
+        if self._digest_timer is not None:
+            self._digest_timer.cancel()
+            self._digest_timer = None
+        if not self.pending_alerts:
+            return
+        msg = format_digest(self.pending_alerts)
+        print(f"NOTIFICATION: {msg}")
+        self.notifier.send(msg)
+        self.pending_alerts = []
+
+    def end_window(self):
+        """Counts the devices of the window that just ended as one scan."""
+        now = datetime.now().astimezone()
+        mark_observed(self.kb, now, self.model)
+        for fingerprint in self.window_fingerprints:
+            self.kb['devices'][fingerprint].seen_count += 1
+        log_scan_results(self.scan_log, self.window_devices)
+        if self.kb['plugin_mode'] == 'learning':
+            msg = advance_learning(self.kb, now, self.learning_hours, self.regularity_threshold, self.model)
+            if msg:
+                self.changed.update(self.kb['devices'])
+                self.notifier.send(msg)
+        self.window_devices = {}
+        self.window_fingerprints = set()
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        now = datetime.now().astimezone()
+        if seed_presence(self.kb, now, self.model):
+            self.changed.update(self.kb['devices'])
+        mark_observed(self.kb, now, self.model)
+        next_window = self._loop.time() + self.scan_window
+        next_flush = self._loop.time() + self.flush_interval
+        try:
+            async with BleakScanner(detection_callback=self.on_advertisement):
+                print(f"Listening for Bluetooth devices continuously, in {self.kb['plugin_mode']} mode. Press Ctrl+C to stop.")
+                while True:
+                    await asyncio.sleep(max(0, min(next_window, next_flush) - self._loop.time()))
+                    now = self._loop.time()
+                    if now >= next_window:
+                        self.end_window()
+                        next_window += self.scan_window
+                    if now >= next_flush:
+                        self.refresh(datetime.now().astimezone())
+                        self.save()
+                        next_flush += self.flush_interval
+        finally:
+            # Also reached when the task is stopped, so nothing seen so far is lost
+            self.send_digest()
+            if self.window_fingerprints:
+                self.end_window()
+            self.save()
+            print("Knowledge base updated.")
+
+    def refresh(self, now: datetime):
+        """Re-evaluates every device, including those not seen lately, and forgets stale ones."""
+        if self.kb['plugin_mode'] == 'monitoring':
+            self.changed |= evaluate_regularity(self.kb, list(self.kb['devices']), now, self.model, self.regularity_threshold)
+        self.changed |= prune_knowledge_base(self.kb, now, self.address_max_age, self.device_max_age)
+
+    def save(self):
+        save_knowledge_base(self.store, self.kb, self.changed)
+        self.changed = set()
+
 async def run(config: dict):
     """
     Main plugin function to learn regular Bluetooth devices and notify on anomalies.
@@ -99,107 +384,77 @@ async def run(config: dict):
 
     # Load configuration
     kb_file = task_config.get('knowledge_base_file')
-    log_file = task_config.get('scan_log_file')
-    learning_hours = task_config.get('learning_duration_hours', 4)
-    regularity_threshold = task_config.get('regularity_threshold', 0.7)
-    ignore_list = task_config.get('ignore_list') or []
 
-    if not all([kb_file, log_file]):
-        print("Error: bluetooth_tracker task is not configured correctly. Ensure 'knowledge_base_file' and 'scan_log_file' are set.")
+    if not kb_file or not (task_config.get('scan_log_dir') or task_config.get('scan_log_file')):
+        print("Error: bluetooth_tracker task is not configured correctly. Ensure 'knowledge_base_file' and 'scan_log_dir' are set.")
+        return
+    try:
+        scan_log = ScanLog.from_config(task_config)
+    except OSError as e:
+        print(f"Error opening scan log: {e}")
         return
 
     # Load or initialize the knowledge base
-    kb = load_knowledge_base(kb_file)
-    if kb is None:
-        kb = initialize_knowledge_base()
+    store = open_knowledge_base(kb_file)
+    try:
+        kb = store.load()
+        if kb is None:
+            kb = initialize_knowledge_base()
+
+        if task_config.get('mode', 'scan') == 'continuous':
+            await ContinuousTracker(kb, store, scan_log, task_config, notifier).run()
+        else:
+            await scan_once(kb, store, scan_log, task_config, notifier)
+    finally:
+        store.close()
+
+async def scan_once(kb: dict, store: DeviceStore, scan_log: ScanLog, task_config: dict, notifier: Notifier):
+    """Scans once, updates the knowledge base with the results and reports unexpected devices."""
+    learning_hours = task_config.get('learning_duration_hours', 4)
+    regularity_threshold = task_config.get('regularity_threshold', 0.7)
+    ignore_list = task_config.get('ignore_list') or []
+    alert_cooldown = timedelta(minutes=task_config.get('alert_cooldown_minutes', DEFAULT_ALERT_COOLDOWN_MINUTES))
+    max_addresses, address_max_age, device_max_age = eviction_settings(task_config)
+    model = PresenceModel.from_config(task_config)
 
     # Perform scan and log results
     print("Scanning for Bluetooth devices...")
     found_devices = await scan_devices()
     print(f"Scan complete. Found {len(found_devices)} devices.")
-    log_scan_results(log_file, found_devices)
+    log_scan_results(scan_log, found_devices)
 
     # --- Update knowledge base with current scan ---
     now = datetime.now().astimezone()
-    now_iso = now.isoformat()
 
+    changed = set(kb['devices']) if seed_presence(kb, now, model) else set()
+    mark_observed(kb, now, model)
     for address, device_data in found_devices.items():
-        fingerprint = create_fingerprint(device_data)
-
-        if fingerprint not in kb['devices']:
-            # This is a new fingerprint
-            kb['devices'][fingerprint] = {
-                "name": device_data['name'],
-                "addresses": {address: now_iso},
-                "seen_count": 0,
-                "first_seen": now_iso,
-                "is_regular": False,
-                "last_rssi": device_data['rssi'],
-                "fingerprint_data": {
-                    "manufacturer_data_keys": sorted(list(device_data.get("manufacturer_data", {}).keys())),
-                    "service_uuids": sorted(device_data.get("service_uuids", []))
-                }
-            }
-
-        kb_device = kb['devices'][fingerprint]
-        # Update name if it was "Unknown" and we found a better one
-        if kb_device['name'] == "Unknown Device" and device_data['name'] != "Unknown Device":
-            kb_device['name'] = device_data['name']
-
-        kb_device['seen_count'] += 1
-        kb_device['last_seen'] = now_iso
-        kb_device['addresses'][address] = now_iso # Add or update address
-        kb_device['last_rssi'] = device_data['rssi']
+        record_device(kb, address, device_data, now, model, max_addresses).seen_count += 1
+        changed.add(device_data['fingerprint'])
 
     # --- Main Logic: Learning vs. Monitoring ---
     if kb['plugin_mode'] == 'learning':
-        kb['total_scans_in_learning_phase'] += 1
-        start_time = datetime.fromisoformat(kb['learning_start_time'])
-        learning_duration = timedelta(hours=learning_hours)
-
-        if now >= start_time + learning_duration:
-            print("Learning phase complete. Calculating baseline of regular devices...")
-            total_scans = kb['total_scans_in_learning_phase']
-            regular_device_count = 0
-            
-            if total_scans > 0:
-                for address, device in kb['devices'].items():
-                    presence_ratio = device['seen_count'] / total_scans
-                    if presence_ratio >= regularity_threshold:
-                        device['is_regular'] = True
-                        regular_device_count += 1
-            
-            kb['plugin_mode'] = 'monitoring'
-            msg = f"Bluetooth tracker is now in monitoring mode. Identified {regular_device_count} regular devices."
-            print(msg)
+        msg = advance_learning(kb, now, learning_hours, regularity_threshold, model)
+        if msg:
+            changed.update(kb['devices'])
             notifier.send(msg)
-        else:
-            elapsed = now - start_time
-            print(f"In learning mode. Scan {kb['total_scans_in_learning_phase']}. Time elapsed: {str(elapsed).split('.')[0]}/{learning_duration}")
 
     elif kb['plugin_mode'] == 'monitoring':
         print("In monitoring mode. Checking for unexpected devices...")
-        reported_fingerprints = set()
-
-        for address, device_data in found_devices.items():
-            if address in ignore_list or device_data['name'] in ignore_list:
-                continue
-
-            fingerprint = create_fingerprint(device_data)
-            if fingerprint in reported_fingerprints:
-                continue
-
-            is_known_regular = kb['devices'].get(fingerprint, {}).get('is_regular', False)
-
-            if not is_known_regular:
-                known_name = kb['devices'].get(fingerprint, {}).get('name', device_data.get('name', 'Unknown Device'))
-                msg = f"Unexpected device detected: '{known_name}' (current address: {address})."
-                print(f"NOTIFICATION: {msg}")
-                notifier.send(msg)
-                reported_fingerprints.add(fingerprint)
+        # Devices become regular, or stop being so, as their presence over the window changes
+        changed |= evaluate_regularity(kb, list(kb['devices']), now, model, regularity_threshold)
+        alerts, suppressed = collect_alerts(found_devices, kb, ignore_list, now, alert_cooldown)
+        if suppressed:
+            print(f"{suppressed} unexpected device(s) were already reported within the last {alert_cooldown}.")
+        if alerts:
+            # All devices of a scan go out as one notification
+            msg = format_digest(alerts)
+            print(f"NOTIFICATION: {msg}")
+            notifier.send(msg)
 
-    # Save the updated knowledge base
-    save_knowledge_base(kb_file, kb)
+    # Save the devices seen in this scan
+    changed |= prune_knowledge_base(kb, now, address_max_age, device_max_age)
+    save_knowledge_base(store, kb, changed)
     print("Knowledge base updated.")
 
 if __name__ == '__main__':
@@ -211,12 +466,12 @@ if __name__ == '__main__':
                 'learning_duration_hours': 0.05, # Short duration for testing
                 'regularity_threshold': 0.5,
                 'ignore_list': [],
-                'knowledge_base_file': ".bluetooth_knowledge_base.json",
-                'scan_log_file': "bluetooth_scans.log"
+                'knowledge_base_file': ".bluetooth_knowledge_base.sqlite",
+                'scan_log_dir': "bluetooth_scans"
             }
         }
     }
     # Clean up old files for a fresh test run
-    if os.path.exists(".bluetooth_knowledge_base.json"):
-        os.remove(".bluetooth_knowledge_base.json")
+    if os.path.exists(".bluetooth_knowledge_base.sqlite"):
+        os.remove(".bluetooth_knowledge_base.sqlite")
     asyncio.run(run(mock_config))
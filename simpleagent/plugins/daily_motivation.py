@@ -1,13 +1,21 @@
 # plugins/daily_motivation.py
 import json
 from pathlib import Path
-from modules.ollama_client import OllamaClient
+from modules.ollama_client import OllamaClient, open_client
 from modules.notifier import Notifier
+from modules.embedding_store import EmbeddingStore, cosine_similarities
 
 # Define constants for history management
 # Store user-writable history in the user's home directory
 HISTORY_FILE = Path.home() / ".simpleagent_motivation_history.json"
-HISTORY_LENGTH = 20 # Keep the last 20 messages
+HISTORY_LENGTH = 1000 # Keep the last 1000 messages
+PROMPT_HISTORY_LENGTH = 20 # Messages added to the prompt when embeddings are unavailable
+
+# Defaults for the embedding-based novelty check
+DEFAULT_EMBEDDING_MODEL = "nomic-embed-text"
+DEFAULT_SIMILARITY_THRESHOLD = 0.9 # Messages at least this similar to a past one are regenerated
+DEFAULT_MAX_ATTEMPTS = 3
+EMBED_BATCH_SIZE = 64 # Texts embedded per request
 
 def load_history():
     """Loads the motivation history from the file."""
@@ -19,40 +27,117 @@ def load_history():
         except json.JSONDecodeError:
             return [] # Return empty list if file is corrupt or empty
 
-def save_history(history: list, new_message: str):
+def save_history(history: list, new_message: str, history_length: int = HISTORY_LENGTH):
     """Saves the updated motivation history."""
     history.append(new_message)
     # Keep the history list to a fixed size
-    updated_history = history[-HISTORY_LENGTH:]
+    updated_history = history[-history_length:]
     with open(HISTORY_FILE, 'w') as f:
         json.dump(updated_history, f, indent=2)
+    return updated_history
+
+def embed_texts(ollama: OllamaClient, store: EmbeddingStore, model: str, texts: list):
+    """
+    Returns the normalized embedding vectors of texts, in order. Vectors are
+    taken from the store where possible, and only new texts are sent to Ollama.
+    Returns None if the embeddings could not be computed.
+    """
+    vectors = store.get_many(model, texts)
+    missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+    for i in range(0, len(missing), EMBED_BATCH_SIZE):
+        batch = missing[i:i + EMBED_BATCH_SIZE]
+        embeddings = ollama.embed(model, batch)
+        if embeddings is None:
+            print(f"Warning: Could not compute embeddings: {ollama.last_metrics['error']}")
+            return None
+        vectors.update(store.put_many(model, dict(zip(batch, embeddings))))
+    return [vectors[text] for text in texts]
+
+def generate_novel_message(ollama, store, config: dict, recent_messages: list):
+    """
+    Generates messages until one is less similar than the threshold to every
+    past message, judged by the cosine similarity of their embeddings.
+    Returns the message and its embedding, or the least similar candidate if
+    no attempt was novel enough.
+    """
+    task_config = config['tasks']['daily_motivation']
+    base_prompt = task_config['prompt']
+    system_prompt = task_config.get('system_prompt') # Get optional system prompt
+    model = config.get('default_model', 'gemma3:12b')
+    embedding_model = task_config.get('embedding_model', DEFAULT_EMBEDDING_MODEL)
+    threshold = float(task_config.get('similarity_threshold', DEFAULT_SIMILARITY_THRESHOLD))
+    max_attempts = max(1, int(task_config.get('max_attempts', DEFAULT_MAX_ATTEMPTS)))
+
+    history_vectors = embed_texts(ollama, store, embedding_model, recent_messages)
+    if history_vectors is None:
+        return None, None
+
+    best = (None, None, float('inf'))
+    prompt = base_prompt
+    for attempt in range(max_attempts):
+        # A cached response would only repeat the rejected message
+        message = ollama.generate(model=model, prompt=prompt, system=system_prompt, use_cache=attempt == 0)
+        if not message or "Error" in message:
+            return message, None
+        vector = embed_texts(ollama, store, embedding_model, [message])
+        if vector is None:
+            return message, None
+
+        similarities = cosine_similarities(vector[0], history_vectors)
+        similarity = max(similarities, default=0.0)
+        if similarity < best[2]:
+            best = (message, vector[0], similarity)
+        if similarity < threshold:
+            return message, vector[0]
+
+        closest = recent_messages[similarities.index(similarity)]
+        print(f"Attempt {attempt + 1}: message is too similar ({similarity:.2f}) to: {closest}")
+        prompt = f"{base_prompt}\n\nDo not write anything similar to: {closest}"
+
+    return best[0], best[1]
 
 def run(config: dict):
     """
     Generates a daily motivational message, avoiding recent ones, and sends it.
+    Instead of listing past messages in the prompt, each new message is compared
+    with all of them through their embeddings, and regenerated if it is too
+    close to one. If embeddings are unavailable, the most recent messages are
+    added to the prompt instead.
     """
     task_config = config['tasks']['daily_motivation']
     base_prompt = task_config['prompt']
     system_prompt = task_config.get('system_prompt') # Get optional system prompt
     model = config.get('default_model', 'gemma3:12b')
-    
-    # Load history and enhance the prompt
+    embedding_model = task_config.get('embedding_model', DEFAULT_EMBEDDING_MODEL)
+    history_length = int(task_config.get('history_length', HISTORY_LENGTH))
+
     recent_messages = load_history()
-    if recent_messages:
-        history_prompt_addition = "\n\nPlease do not repeat any of the following recent messages:\n- " + "\n- ".join(recent_messages)
-        full_prompt = base_prompt + history_prompt_addition
-    else:
-        full_prompt = base_prompt
+    store = EmbeddingStore(task_config.get('embedding_file'))
 
     print("Generating motivational message...")
-    ollama = OllamaClient(config)
-    message = ollama.generate(model=model, prompt=full_prompt, system=system_prompt)
-    
-    print(f"Generated Message: {message}")
-    
-    # Update and save the history if the message is valid
-    if message and "Error" not in message:
-        save_history(recent_messages, message)
+    try:
+        with open_client(config) as ollama:
+            message, vector = generate_novel_message(ollama, store, config, recent_messages)
+            if message is None:
+                # Fall back to listing the most recent messages in the prompt
+                prompt_history = recent_messages[-PROMPT_HISTORY_LENGTH:]
+                if prompt_history:
+                    history_prompt_addition = "\n\nPlease do not repeat any of the following recent messages:\n- " + "\n- ".join(prompt_history)
+                    full_prompt = base_prompt + history_prompt_addition
+                else:
+                    full_prompt = base_prompt
+                message = ollama.generate(model=model, prompt=full_prompt, system=system_prompt)
+
+            print(f"Generated Message: {message}")
+
+            # Update and save the history if the message is valid
+            if message and "Error" not in message:
+                history = save_history(recent_messages, message, history_length)
+                if vector is not None:
+                    # Drop the vectors of messages that fell out of the history
+                    store.prune(embedding_model, history)
+    finally:
+        store.close()
 
     notifier = Notifier(config)
     notifier.send(message)
@@ -1,27 +1,325 @@
 # plugins/log_summarizer.py
-from modules.ollama_client import OllamaClient
+import asyncio
+import glob
+import hashlib
+import itertools
+import json
+import os
+from pathlib import Path
+from modules.ollama_client import open_async_client
+from modules.ollama_metrics import format_metrics
+from modules.log_compressor import LogCompressor
 
-def run(config: dict):
+# Where the offset reached in each log is stored between runs
+STATE_FILE = Path.home() / ".simpleagent_log_summarizer_state.json"
+# The start of the log is hashed to notice when it was truncated and has grown back
+FINGERPRINT_SIZE = 1024
+
+# Defaults for chunked summarization of large logs
+DEFAULT_CHUNK_SIZE_KB = 64      # Log text sent to the model per request
+DEFAULT_MAX_PARALLEL = 2        # Chunks summarized at the same time
+DEFAULT_REDUCE_BATCH_SIZE = 8   # Partial summaries merged per request
+DEFAULT_REDUCE_PROMPT = (
+    "The following are summaries of consecutive parts of one log file, in order. "
+    "Combine them into a single summary of the key events and errors:"
+)
+DEFAULT_RUNNING_SUMMARY_PROMPT = (
+    "Below is the summary of earlier entries of the same log. Combine it with the "
+    "new entries above into one updated summary, keeping earlier findings that still matter:"
+)
+
+def load_state(state_file: Path) -> dict:
+    """Loads the saved offsets, keyed by log file path."""
+    if not state_file.exists():
+        return {}
+    with open(state_file, 'r') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return {} # Start over if the file is corrupt or empty
+
+def save_state(state_file: Path, state: dict):
+    """Saves the offsets, replacing the file in one step so an interrupted run can't corrupt it."""
+    temp_file = state_file.with_name(state_file.name + ".tmp")
+    with open(temp_file, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_file, state_file)
+
+def fingerprint(path: str, length: int) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+def find_rotated_file(log_file_path: str, dev: int, inode: int):
+    """
+    Finds the file a rotated log was renamed to (e.g. app.log.1), by its inode.
+    Compressed rotations can't be read incrementally and are not considered.
+    """
+    for candidate in sorted(glob.glob(glob.escape(log_file_path) + ".*")):
+        if candidate.endswith((".gz", ".bz2", ".xz", ".zst")):
+            continue
+        try:
+            st = os.stat(candidate)
+        except OSError:
+            continue
+        if (st.st_dev, st.st_ino) == (dev, inode):
+            return candidate
+    return None
+
+def plan_reads(log_file_path: str, st: os.stat_result, previous: dict) -> list:
+    """
+    Works out which byte ranges hold entries that were not summarized yet, as a
+    list of (path, start, end). After a logrotate-style rename, the rest of the
+    old file is read before the new one; after a truncation the log is read
+    from the start.
+    """
+    if not previous:
+        return [(log_file_path, 0, st.st_size)]
+
+    if (st.st_dev, st.st_ino) != (previous['dev'], previous['inode']):
+        reads = []
+        rotated = find_rotated_file(log_file_path, previous['dev'], previous['inode'])
+        if rotated:
+            print(f"Log was rotated, reading the rest of {rotated} first.")
+            rotated_size = os.path.getsize(rotated)
+            if rotated_size > previous['offset']:
+                reads.append((rotated, previous['offset'], rotated_size))
+        else:
+            print("Log was rotated, and the rest of the previous file could not be found.")
+        reads.append((log_file_path, 0, st.st_size))
+        return reads
+
+    if st.st_size < previous['offset'] or \
+            fingerprint(log_file_path, previous['fingerprint_size']) != previous['fingerprint']:
+        print("Log was truncated, reading it from the start.")
+        return [(log_file_path, 0, st.st_size)]
+
+    return [(log_file_path, previous['offset'], st.st_size)]
+
+def complete_lines_end(path: str, start: int, end: int, chunk_size: int) -> int:
+    """
+    Returns the offset just after the last complete line before end, so a line
+    that is still being written is left for the next run. A partial line longer
+    than a chunk is taken as it is.
+    """
+    with open(path, 'rb') as f:
+        position = end
+        while position > start and end - position <= chunk_size:
+            block_start = max(start, position - 4096)
+            f.seek(block_start)
+            block = f.read(position - block_start)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                return block_start + newline + 1
+            position = block_start
+    return end if end - start > chunk_size else start
+
+def read_lines(log_file_path: str, start: int = 0, end: int = None, max_line_length: int = 64 * 1024):
+    """
+    Yields the lines between byte offsets start and end of the log file, without
+    reading the file into memory. Very long lines are split at max_line_length.
+    """
+    with open(log_file_path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start if end is not None else float('inf')
+        while remaining > 0:
+            line = f.readline(int(min(max_line_length, remaining)))
+            if not line:
+                break
+            remaining -= len(line)
+            yield line.decode('utf-8', errors='replace')
+
+def chunk_lines(lines, chunk_size: int):
+    """
+    Groups lines into chunks of at most about chunk_size characters, so only
+    one chunk has to be held in memory at a time.
+    """
+    chunk = []
+    chunk_length = 0
+    for line in lines:
+        if chunk and chunk_length + len(line) > chunk_size:
+            yield "".join(chunk)
+            chunk = []
+            chunk_length = 0
+        chunk.append(line)
+        chunk_length += len(line)
+    if chunk:
+        yield "".join(chunk)
+
+async def generate_checked(ollama, model: str, prompt: str) -> tuple:
+    """
+    Returns the response to a prompt and whether the request succeeded, going
+    by the error the client records in its metrics rather than by the text,
+    which may itself start with "Error". last_metrics is read as soon as the
+    call returns, before any other request on the shared client can finish.
+    """
+    response = await ollama.generate(model=model, prompt=prompt)
+    return response, ollama.last_metrics['error'] is None
+
+async def summarize_chunks(ollama, model: str, base_prompt: str, chunks, max_parallel: int) -> tuple:
+    """
+    Map step: summarizes every chunk, with at most max_parallel requests (and
+    chunks in memory) at once. Returns the partial summaries in file order,
+    leaving out the parts that failed, and the number of failed parts.
+    """
+    slots = asyncio.Semaphore(max_parallel)
+    summaries = []
+    tasks = []
+
+    async def summarize(index: int, chunk: str):
+        try:
+            prompt = f"{base_prompt}\n\n---LOGS (part {index + 1})---\n{chunk}"
+            summary, ok = await generate_checked(ollama, model, prompt)
+            if not ok:
+                print(f"Failed to summarize part {index + 1}: {summary}")
+            else:
+                summaries[index] = summary
+                print(f"Summarized part {index + 1}.")
+        finally:
+            slots.release()
+
+    for index, chunk in enumerate(chunks):
+        # Wait for a free slot before reading further into the file
+        await slots.acquire()
+        summaries.append(None)
+        tasks.append(asyncio.create_task(summarize(index, chunk)))
+    await asyncio.gather(*tasks)
+    succeeded = [summary for summary in summaries if summary is not None]
+    return succeeded, len(summaries) - len(succeeded)
+
+def build_reduce_prompt(reduce_prompt: str, summaries: list) -> str:
+    parts = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(summaries))
+    return f"{reduce_prompt}\n\n---PARTIAL SUMMARIES---\n{parts}"
+
+async def reduce_summaries(ollama, model: str, reduce_prompt: str, summaries: list, batch_size: int) -> tuple:
+    """
+    Reduce step: merges partial summaries in batches until no more than
+    batch_size remain, so the final prompt always fits in the model's context.
+    Returns the merged summaries and None, or, as soon as a merge fails, the
+    summaries so far and the error, so it isn't merged into the next round as
+    if it were a summary.
+    """
+    while len(summaries) > batch_size:
+        batches = [summaries[i:i + batch_size] for i in range(0, len(summaries), batch_size)]
+        print(f"Merging {len(summaries)} partial summaries into {len(batches)}...")
+        results = await asyncio.gather(*(
+            generate_checked(ollama, model, build_reduce_prompt(reduce_prompt, batch))
+            for batch in batches
+        ))
+        errors = [response for response, ok in results if not ok]
+        if errors:
+            return summaries, errors[0]
+        summaries = [response for response, _ in results]
+    return summaries, None
+
+async def run(config: dict):
     """
     Reads a log file, summarizes it, and prints the summary.
+    Only entries added since the last run are read, using the offset saved in
+    the state file, so each run costs as much as the new data rather than the
+    whole file. Logs larger than one chunk are summarized chunk by chunk, and
+    the partial summaries are then merged into one.
     """
     task_config = config['tasks']['log_summarizer']
     log_file_path = task_config['log_file_path']
     base_prompt = task_config['prompt']
     model = config.get('default_model', 'gemma3:12b')
+    chunk_size = int(task_config.get('chunk_size_kb', DEFAULT_CHUNK_SIZE_KB) * 1024)
+    max_parallel = max(1, int(task_config.get('max_parallel', DEFAULT_MAX_PARALLEL)))
+    batch_size = max(2, int(task_config.get('reduce_batch_size', DEFAULT_REDUCE_BATCH_SIZE)))
+    reduce_prompt = task_config.get('reduce_prompt', DEFAULT_REDUCE_PROMPT)
+    incremental = task_config.get('incremental', True)
+    use_running_summary = task_config.get('running_summary', False)
+    running_summary_prompt = task_config.get('running_summary_prompt', DEFAULT_RUNNING_SUMMARY_PROMPT)
+    state_file = Path(task_config.get('state_file') or STATE_FILE).expanduser()
+    compress = task_config.get('compress', True)
+    state_key = os.path.abspath(log_file_path)
 
+    state = load_state(state_file) if incremental else {}
+    previous = state.get(state_key)
     try:
-        with open(log_file_path, 'r') as f:
-            log_content = f.read()
+        st = os.stat(log_file_path)
+        reads = plan_reads(log_file_path, st, previous)
+        # A line that is still being written is left for the next run
+        path, start, end = reads[-1]
+        end = complete_lines_end(path, start, end, chunk_size)
+        reads[-1] = (path, start, end)
+        def new_lines():
+            return itertools.chain.from_iterable(read_lines(p, s, e, chunk_size) for p, s, e in reads)
+
+        lines = new_lines()
+        if compress:
+            # Send templates with counts instead of every repeated line
+            compressor = LogCompressor()
+            # Compressing is CPU-bound, so keep it off the event loop shared with other tasks
+            await asyncio.to_thread(compressor.add_lines, lines)
+            compressed = compressor.render()
+            if len(compressed) < compressor.input_chars:
+                print(f"Compressed {compressor.input_lines} log lines from {compressor.input_chars} "
+                      f"to {len(compressed)} characters ({compressor.input_chars / len(compressed):.1f}x smaller).")
+                lines = compressed.splitlines(keepends=True)
+            else:
+                # Nothing repeats enough to be worth it, send the lines as they are
+                lines = new_lines()
+        chunks = chunk_lines(lines, chunk_size)
+        first_chunk = next(chunks, None)
+        second_chunk = next(chunks, None)
     except FileNotFoundError:
         print(f"Error: Log file not found at {log_file_path}")
         return
 
-    full_prompt = f"{base_prompt}\n\n---LOGS---\n{log_content}"
-    
-    print("Summarizing logs...")
-    ollama = OllamaClient(config)
-    summary = ollama.generate(model=model, prompt=full_prompt)
-    
-    print("\n--- Log Summary ---")
-    print(summary)
+    if first_chunk is None:
+        print("No new log entries since the last run.")
+        return
+
+    async with open_async_client(config) as ollama:
+        if second_chunk is None:
+            # The new entries fit in one request
+            print("Summarizing logs...")
+            full_prompt = f"{base_prompt}\n\n---LOGS---\n{first_chunk}"
+        else:
+            print("New log entries don't fit in one request, summarizing them in parts...")
+            all_chunks = itertools.chain([first_chunk, second_chunk], chunks)
+            summaries, failed_parts = await summarize_chunks(ollama, model, base_prompt, all_chunks, max_parallel)
+            if failed_parts:
+                # Keep the saved offset, so the next run reads these entries again
+                print(f"Error: {failed_parts} part(s) of the new log entries could not be summarized. "
+                      "They will be summarized again on the next run.")
+                return
+            summaries, error = await reduce_summaries(ollama, model, reduce_prompt, summaries, batch_size)
+            if error:
+                print(f"Error: Could not merge the partial summaries, they will be summarized again on the next run: {error}")
+                return
+            full_prompt = build_reduce_prompt(reduce_prompt, summaries)
+
+        # Roll the new findings into the summary kept from earlier runs
+        previous_summary = previous.get('summary') if previous and use_running_summary else None
+        if previous_summary:
+            full_prompt = f"{full_prompt}\n\n{running_summary_prompt}\n\n---EARLIER SUMMARY---\n{previous_summary}"
+
+        # Print the summary as it is generated instead of waiting for all of it
+        print("\n--- Log Summary ---")
+        tokens = []
+        async for token in ollama.generate_stream(model=model, prompt=full_prompt):
+            tokens.append(token)
+            print(token, end="", flush=True)
+        print()
+
+        # The stream may fail after some tokens, so go by the error recorded for the call
+        succeeded = ollama.last_metrics['error'] is None
+        print(f"({format_metrics(ollama.last_metrics)})")
+        if not succeeded:
+            print("Error: The summary could not be completed, these log entries will be summarized again on the next run.")
+
+    summary = "".join(tokens)
+    # Only move past these entries once they were summarized, so a failed run is retried
+    if incremental and succeeded:
+        fingerprint_size = min(end, FINGERPRINT_SIZE)
+        state[state_key] = {
+            'dev': st.st_dev,
+            'inode': st.st_ino,
+            'offset': end,
+            'fingerprint_size': fingerprint_size,
+            'fingerprint': fingerprint(log_file_path, fingerprint_size),
+            'summary': summary if use_running_summary else None,
+        }
+        save_state(state_file, state)
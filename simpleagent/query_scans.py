@@ -0,0 +1,140 @@
+# query_scans.py
+"""
+Answers questions from the structured scan log of the bluetooth_tracker task,
+such as when a device was seen or how often devices were present over the
+last few days. Only the log segments that can match are read, see ScanLog.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from main import load_configuration
+from modules.device_store import knowledge_base_paths, read_device_names
+from modules.scan_log import ScanLog
+
+def format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).astimezone().strftime("%Y-%m-%d %H:%M:%S")
+
+def device_names(task_config: dict) -> dict:
+    """Returns the names of the devices in the knowledge base by fingerprint ID, if it exists."""
+    kb_file = task_config.get('knowledge_base_file')
+    if not kb_file:
+        return {}
+    sqlite_path, json_path = knowledge_base_paths(kb_file)
+    if not sqlite_path.exists():
+        if json_path.exists():
+            print(f"Note: {json_path} hasn't been migrated by bluetooth_tracker yet, so devices are shown by address.\n")
+        return {}
+    try:
+        return read_device_names(kb_file)
+    except sqlite3.Error as e:
+        print(f"Warning: Could not read device names from {sqlite_path}: {e}")
+        return {}
+
+def seen(scan_log: ScanLog, device: str, since: float, gap_minutes: float):
+    """Prints the visits of a device, given by fingerprint ID or MAC address."""
+    by_address = ':' in device
+    if by_address:
+        device = device.upper()
+    column = 1 if by_address else 0
+    visits = []   # [first, last, sightings, addresses, min RSSI, max RSSI]
+    for scan in scan_log.scans(since=since, **{'address' if by_address else 'fingerprint': device}):
+        matches = [entry for entry in scan['devices'] if entry[column] == device]
+        if not matches:
+            continue
+        rssis = [rssi for _, _, rssi in matches]
+        if visits and scan['t'] - visits[-1][1] <= gap_minutes * 60:
+            visit = visits[-1]
+            visit[1] = scan['t']
+            visit[2] += 1
+            visit[3].update(entry[1 - column] for entry in matches)
+            visit[4] = min(visit[4], *rssis)
+            visit[5] = max(visit[5], *rssis)
+        else:
+            visits.append([scan['t'], scan['t'], 1, {entry[1 - column] for entry in matches}, min(rssis), max(rssis)])
+
+    if not visits:
+        print(f"{device} was not seen.")
+        return
+    other = "Fingerprints" if by_address else "Addresses"
+    print(f"{device} was seen in {sum(v[2] for v in visits)} scans, {len(visits)} visit(s):")
+    print(f"{'From':<19} | {'Until':<19} | {'Scans':>5} | {'RSSI':>9} | {other}")
+    print("-" * 90)
+    for first, last, sightings, others, low, high in visits:
+        print(f"{format_time(first):<19} | {format_time(last):<19} | {sightings:>5} | {f'{low}..{high}':>9} | {', '.join(sorted(others))}")
+
+def presence(scan_log: ScanLog, since: float, fingerprint: str, names: dict):
+    """
+    Prints the share of scans in which each device, or the given one, was
+    present, by name or, for devices without one, by the last address seen.
+    """
+    total = scan_log.count_scans(since=since)
+    if total == 0:
+        print("No scans were logged in that time.")
+        return
+    counts = defaultdict(int)
+    last_seen = {}
+    last_address = {}
+    days = defaultdict(int)
+    for scan in scan_log.scans(since=since, fingerprint=fingerprint):
+        addresses = {fp: address for fp, address, _ in scan['devices']
+                     if fingerprint is None or fp == fingerprint}
+        if fingerprint is not None and addresses:
+            days[datetime.fromtimestamp(scan['t']).date()] += 1
+        for fp, address in addresses.items():
+            counts[fp] += 1
+            last_seen[fp] = scan['t']
+            last_address[fp] = address
+
+    print(f"{total} scans since {format_time(since)}.")
+    if fingerprint is not None and days:
+        print(f"{'Day':<10} | {'Scans':>5}")
+        print("-" * 18)
+        for day, sightings in sorted(days.items()):
+            print(f"{day.isoformat():<10} | {sightings:>5}")
+        print()
+    print(f"{'Fingerprint':<16} | {'Name or last address':<30} | {'Scans':>5} | {'Share':>6} | {'Last seen'}")
+    print("-" * 90)
+    for fp, count in sorted(counts.items(), key=lambda item: -item[1]):
+        name = (names.get(fp) or last_address[fp])[:30]
+        print(f"{fp:<16} | {name:<30} | {count:>5} | {count / total:>6.0%} | {format_time(last_seen[fp])}")
+    if fingerprint is not None and not counts:
+        print(f"{fingerprint} was not seen.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the bluetooth_tracker scan log.")
+    parser.add_argument("-c", "--config", help="Path to the configuration file (config.yaml).")
+    parser.add_argument("--dir", help="Scan log directory (default: 'scan_log_dir' of the bluetooth_tracker task)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    seen_parser = subparsers.add_parser("seen", help="When was a device seen")
+    seen_parser.add_argument("device", help="Fingerprint ID or MAC address")
+    seen_parser.add_argument("--days", type=float, help="Only look at the last N days (default: all)")
+    seen_parser.add_argument("--gap", type=float, default=30,
+                             help="Sightings this many minutes apart or less are one visit (default: 30)")
+    presence_parser = subparsers.add_parser("presence", help="How often devices were present")
+    presence_parser.add_argument("--days", type=float, default=7, help="Look at the last N days (default: 7)")
+    presence_parser.add_argument("--fingerprint", help="Only this fingerprint ID, with its scans per day")
+    args = parser.parse_args()
+
+    try:
+        task_config = load_configuration(args.config).get('tasks', {}).get('bluetooth_tracker') or {}
+    except FileNotFoundError:
+        task_config = {}
+    if args.dir:
+        task_config = dict(task_config, scan_log_dir=args.dir)
+    scan_log = ScanLog.from_config(task_config)
+    if scan_log is None:
+        print("Error: No scan log configured. Set 'scan_log_dir' for the bluetooth_tracker task or pass --dir.")
+        sys.exit(1)
+
+    since = time.time() - args.days * 86400 if args.days is not None else None
+    if args.command == "seen":
+        seen(scan_log, args.device, since, args.gap)
+    else:
+        presence(scan_log, since, args.fingerprint, device_names(task_config))
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@
 # -*- mode: python ; coding: utf-8 -*-
 
 import sys
-from PyInstaller.utils.hooks import collect_data_files
+from PyInstaller.utils.hooks import collect_data_files, collect_submodules
 
 block_cipher = None
 
@@ -16,9 +16,12 @@ datas = [('sample_config.yaml', 'config.yaml')]
 datas += collect_data_files('bleak')
 
 # --- Hidden Imports ---
+# main.py imports plugins by name only when their task runs, which static
+# analysis can't follow, so every module in plugins/ is listed explicitly.
+hiddenimports = collect_submodules('plugins')
+
 # Bleak uses different backends for different operating systems.
 # PyInstaller's static analysis might miss these, so we specify them here.
-hiddenimports = []
 if sys.platform == "win32":
     hiddenimports.append('bleak.backends.winrt')
 elif sys.platform == "darwin":